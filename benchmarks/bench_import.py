@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from wgs_generator import generate  # noqa: E402
+
+# Times importing Steam/Epic saves into wgs containers and checks the round trip for every
+# save handler: saves extracted from a synthetic wgs tree, imported and extracted again must
+# have the same names and contents, e.g. python benchmarks/bench_import.py --containers 1000
+# Also checks that --on-conflict keep-both adds the other files of conflicts as ".conflict"
+# save files next to the chosen ones.
+
+USER_DIR_NAME = f"{0x0009000000000000:016X}_{0:032X}"
+
+
+def extract(
+    games: main.GameList, pkg_name: str, user_dir: Path, on_conflict: str = "newest"
+) -> List[Tuple[str, str]]:
+    # Sorted file names and SHA-256s of the extracted saves. Names that repeat are kept, so
+    # that saves which would overwrite each other fail the round trip.
+    _, containers = main.read_user_containers(user_dir, on_conflict)
+    hashes = []
+    for name, source in main.get_save_paths(games, pkg_name, containers):
+        digest = hashlib.sha256()
+        for chunk in main.iter_source_chunks(source):
+            digest.update(chunk)
+        hashes.append((name, digest.hexdigest()))
+    return sorted(hashes)
+
+
+def write_saves(games: main.GameList, pkg_name: str, user_dir: Path, saves_dir: Path):
+    _, containers = main.read_user_containers(user_dir, "newest")
+    for name, source in main.get_save_paths(games, pkg_name, containers):
+        main.write_source_file(saves_dir / name, source)
+
+
+def check_keep_both(games: main.GameList, pkg_name: str, user_dir: Path) -> bool:
+    # The saves without the suffix are the newest ones, and every ".conflict" save is made
+    # from the other file of a conflict, so it differs from the save it's named after
+    newest = dict(extract(games, pkg_name, user_dir))
+    keep_both = extract(games, pkg_name, user_dir, "keep-both")
+    names = [name for name, _ in keep_both]
+    if len(names) != len(set(names)):
+        return False
+    chosen = {}
+    for name, digest in keep_both:
+        if not name.endswith(main.CONFLICT_COPY_SUFFIX):
+            chosen[name] = digest
+    if chosen != newest:
+        return False
+    for name, digest in keep_both:
+        if name.endswith(main.CONFLICT_COPY_SUFFIX):
+            original = name.removesuffix(main.CONFLICT_COPY_SUFFIX)
+            if chosen.get(original) in (None, digest):
+                return False
+    return True
+
+
+def run(containers: int, files_per_container: int, blob_size: int) -> List[str]:
+    main.interactive = False
+    games = main.read_game_list()
+    failed = []
+    print(
+        f"{'handler':<20} {'containers':>10} {'import time':>15} round trip  keep-both"
+    )
+    for handler, pkg_names in sorted(games.by_handler.items()):
+        pkg_name = pkg_names[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            user_dir = generate(
+                tmp_path / "wgs" / USER_DIR_NAME,
+                pkg_name,
+                container_count=containers,
+                files_per_container=files_per_container,
+                blob_size=blob_size,
+                handler=handler,
+            )
+            saves_dir = tmp_path / "saves" / USER_DIR_NAME
+            imported_dir = tmp_path / "imported" / USER_DIR_NAME
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = extract(games, pkg_name, user_dir)
+                write_saves(games, pkg_name, user_dir, saves_dir)
+                start = time.perf_counter()
+                container_count = main.import_saves(
+                    saves_dir, imported_dir, pkg_name, games
+                )
+                seconds = time.perf_counter() - start
+                actual = extract(games, pkg_name, imported_dir)
+                conflicts_dir = generate(
+                    tmp_path / "conflicts" / USER_DIR_NAME,
+                    pkg_name,
+                    container_count=containers,
+                    files_per_container=files_per_container,
+                    blob_size=blob_size,
+                    handler=handler,
+                    mismatch_ratio=0.5,
+                )
+                keep_both_ok = check_keep_both(games, pkg_name, conflicts_dir)
+            ok = actual == expected
+            if not ok or not keep_both_ok:
+                failed.append(handler)
+            print(
+                f"{handler:<20} {container_count:>10} {seconds * 1000:>12.2f} ms "
+                f"{'ok' if ok else 'MISMATCH':<11} {'ok' if keep_both_ok else 'MISMATCH'}"
+            )
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark importing saves and check the round trip."
+    )
+    parser.add_argument("--containers", type=int, default=100)
+    parser.add_argument("--files-per-container", type=int, default=2)
+    parser.add_argument("--blob-size", type=int, default=4096)
+    args = parser.parse_args()
+    failed = run(args.containers, args.files_per_container, args.blob_size)
+    if failed:
+        sys.exit(f"Round trip or keep-both check failed for: {', '.join(failed)}")
@@ -0,0 +1,117 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from wgs_generator import generate
+
+# Checks that the peak memory of an extraction does not grow with the size of the saves.
+# Writes Starfield containers with sparse blobs of the given total sizes and runs main.py on
+# each of them in a subprocess, e.g. python benchmarks/bench_memory.py --sizes 0.5 5
+
+MAIN_PY = Path(__file__).resolve().parent.parent / "main.py"
+STARFIELD_PKG = "BethesdaSoftworks.ProjectGold_3275kfvn8vcwc"
+GIB = 1024**3
+
+
+def generate_saves(packages_root: Path, total_size: int, containers: int, blobs: int):
+    user_dir = (
+        packages_root
+        / STARFIELD_PKG
+        / "SystemAppData/wgs"
+        / f"{0x0009000000000000:016X}_{0:032X}"
+    )
+    generate(
+        user_dir,
+        STARFIELD_PKG,
+        container_count=containers,
+        files_per_container=blobs,
+        blob_size=0,
+        handler="starfield",
+    )
+    # Grow the blobs without writing them, the files stay sparse on disk
+    blob_paths = [
+        path
+        for path in sorted(user_dir.glob("*/*"))
+        if not path.name.startswith("container.")
+    ]
+    blob_size = total_size // len(blob_paths)
+    for path in blob_paths:
+        os.truncate(path, blob_size)
+    return blob_size * len(blob_paths)
+
+
+def peak_rss(args: list) -> int:
+    # Peak RSS of one extraction in KiB (ru_maxrss of the waited-for children is the maximum
+    # over all of them, so every run gets its own helper process)
+    code = (
+        "import resource, subprocess, sys; "
+        "subprocess.run(sys.argv[1:], check=True, stdout=subprocess.DEVNULL); "
+        "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, sys.executable, str(MAIN_PY)] + args,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return int(result.stdout)
+
+
+def run(sizes: list, containers: int, blobs: int, extra_args: list) -> list:
+    results = []
+    print(f"{'size':>10} {'peak RSS':>12}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            total = generate_saves(
+                tmp_path / "Packages", int(size * GIB), containers, blobs
+            )
+            rss = peak_rss(
+                [
+                    "--packages-root",
+                    str(tmp_path / "Packages"),
+                    "--output-dir",
+                    str(tmp_path / "out"),
+                    "--non-interactive",
+                    "--compression-level",
+                    "1",
+                ]
+                + extra_args
+            )
+            results.append((total, rss))
+            print(f"{total / GIB:>8.2f} GB {rss / 1024:>9.1f} MiB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that peak memory stays constant while extracting large saves."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[0.5, 5],
+        help="total save sizes in GB (default: 0.5 5)",
+    )
+    parser.add_argument("--containers", type=int, default=10)
+    parser.add_argument("--blobs", type=int, default=4, help="blobs per container")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=16,
+        help="allowed peak RSS growth over the smallest size in MiB (default: 16)",
+    )
+    parser.add_argument(
+        "main_args", nargs="*", help="extra main.py options, e.g. -- --format tar"
+    )
+    args = parser.parse_args()
+    results = run(args.sizes, args.containers, args.blobs, args.main_args)
+    growth = (max(rss for _, rss in results) - results[0][1]) / 1024
+    if growth > args.tolerance:
+        sys.exit(f"Peak RSS grew by {growth:.1f} MiB")
+    print(f"Peak RSS grew by {growth:.1f} MiB")
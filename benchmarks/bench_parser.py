@@ -0,0 +1,94 @@
+import struct
+import sys
+import tempfile
+import timeit
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from wgs_generator import generate  # noqa: E402
+
+# Compares main.read_user_containers against the previous reader that did one f.read() per field.
+
+
+def legacy_read_utf16_str(f, str_len=None) -> str:
+    if not str_len:
+        str_len = struct.unpack("<i", f.read(4))[0]
+    return f.read(str_len * 2).decode("utf-16").rstrip("\0")
+
+
+def legacy_read_user_containers(user_wgs_dir: Path):
+    containers = []
+    with (user_wgs_dir / "containers.index").open("rb") as f:
+        f.read(4)
+        container_count = struct.unpack("<i", f.read(4))[0]
+        legacy_read_utf16_str(f)
+        store_pkg_name = legacy_read_utf16_str(f).split("!")[0]
+        struct.unpack("<Q", f.read(8))
+        f.read(4)
+        legacy_read_utf16_str(f)
+        f.read(8)
+        for _ in range(container_count):
+            container_name = legacy_read_utf16_str(f)
+            legacy_read_utf16_str(f)
+            legacy_read_utf16_str(f)
+            container_num = struct.unpack("B", f.read(1))[0]
+            f.read(4)
+            container_guid = uuid.UUID(bytes_le=f.read(16))
+            main.filetime_to_datetime(struct.unpack("<Q", f.read(8))[0])
+            f.read(16)
+            files = []
+            container_path = user_wgs_dir / container_guid.hex.upper()
+            with (container_path / f"container.{container_num}").open("rb") as cf:
+                cf.read(4)
+                file_count = struct.unpack("<i", cf.read(4))[0]
+                for _ in range(file_count):
+                    file_name = legacy_read_utf16_str(cf, 64)
+                    file_guid = uuid.UUID(bytes_le=cf.read(16))
+                    uuid.UUID(bytes_le=cf.read(16))
+                    files.append(
+                        {"name": file_name, "path": container_path / file_guid.hex.upper()}
+                    )
+            containers.append(
+                {"name": container_name, "number": container_num, "files": files}
+            )
+    return (store_pkg_name, containers)
+
+
+def main_bench():
+    for container_count, files_per_container in ((10, 1), (1000, 4), (5000, 8)):
+        with tempfile.TemporaryDirectory() as tmp:
+            user_dir = generate(
+                Path(tmp) / "0009000000000000_00000000000000000000000000000000",
+                container_count=container_count,
+                files_per_container=files_per_container,
+                blob_size=16,
+            )
+            legacy = legacy_read_user_containers(user_dir)
+            current = main.read_user_containers(user_dir)
+            assert legacy[0] == current[0]
+            assert [(c["name"], c["number"]) for c in legacy[1]] == [
+                (c.name, c.number) for c in current[1]
+            ]
+            assert [[f["path"] for f in c["files"]] for c in legacy[1]] == [
+                [f.path for f in c.files] for c in current[1]
+            ]
+            number = max(1, 1000 // container_count)
+            t_legacy = timeit.timeit(
+                lambda: legacy_read_user_containers(user_dir), number=number
+            )
+            t_current = timeit.timeit(
+                lambda: main.read_user_containers(user_dir), number=number
+            )
+            print(
+                f"{container_count} containers x {files_per_container} files: "
+                f"legacy {t_legacy / number * 1000:.2f} ms, "
+                f"buffered {t_current / number * 1000:.2f} ms "
+                f"({t_legacy / t_current:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from wgs_generator import (  # noqa: E402
+    container_layout,
+    generate,
+    generate_packages_root,
+    to_filetime,
+)
+
+# Times discovery, container parsing, every save handler and archive writing on synthetic
+# wgs trees. Runs offline on any OS, e.g. python benchmarks/run_benchmarks.py --sizes 10 1000
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_containers(handler: str, count: int, files_per_container: int):
+    # In-memory containers as returned by read_user_containers, handlers do not touch the files
+    created = to_filetime(datetime.now(timezone.utc))
+    containers = []
+    for i in range(count):
+        name, file_names = container_layout(handler, i, files_per_container)
+        files = []
+        for j, file_name in enumerate(file_names):
+            guid = uuid.UUID(int=j)
+            files.append(
+                main.ContainerFile(file_name, guid, Path(f"{i:032X}") / f"{j:032X}", guid)
+            )
+        containers.append(
+            main.Container(name, 1 + i % 255, uuid.UUID(int=i), created, files)
+        )
+    return containers
+
+
+def run(
+    sizes: List[int], repeat: int, blob_size: int, threads_count: int = 4
+) -> List[Dict[str, Any]]:
+    main.interactive = False
+    games = main.read_game_list()
+    results = []
+
+    def record(benchmark: str, size: int, seconds: float):
+        results.append({"benchmark": benchmark, "size": size, "seconds": seconds})
+        print(
+            f"{benchmark:<32} {size:>8} {seconds * 1000:>12.2f} ms "
+            f"{seconds / size * 1_000_000:>10.2f} us/item"
+        )
+
+    print(f"{'benchmark':<32} {'size':>8} {'time':>15} {'per item':>18}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+
+            # Discovery: a Packages directory with every supported game and "size" unrelated packages
+            packages_root = generate_packages_root(
+                tmp_path / "Packages",
+                [(pkg_name, game["handler"]) for pkg_name, game in games.items()],
+                unrelated_packages=size,
+                container_count=1,
+                blob_size=16,
+            )
+
+            def discover():
+                for pkg_name in main.discover_games(games, packages_root):
+                    main.find_user_containers(pkg_name, packages_root)
+
+            record("discovery", size, best_time(discover, repeat))
+
+            # Parsing, including GUID mismatches and missing files
+            user_dir = generate(
+                tmp_path / "wgs" / "0009000000000000_00000000000000000000000000000000",
+                container_count=size,
+                files_per_container=2,
+                blob_size=blob_size,
+                mismatch_ratio=0.05,
+                missing_ratio=0.01,
+            )
+            # Conflict decisions are logged, keep them out of the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                parse_time = best_time(
+                    lambda: main.read_user_containers(user_dir, "newest"), repeat
+                )
+                _, parsed_containers = main.read_user_containers(user_dir, "newest")
+            record("parse", size, parse_time)
+
+            # Handlers
+            for handler, pkg_names in sorted(games.by_handler.items()):
+                containers = synthetic_containers(handler, size, 2)
+                record(
+                    f"handler {handler}",
+                    size,
+                    best_time(
+                        lambda: main.get_save_paths(games, pkg_names[0], containers),
+                        repeat,
+                    ),
+                )
+
+            # Archive writing, files with the same GUIDs are not checked while parsing
+            save_paths = [
+                (f"{container.name}/{file.name}", file.path)
+                for container in parsed_containers
+                for file in container.files
+                if file.path.is_file()
+            ]
+            archive_variants = [
+                ("zip", "store", 1),
+                ("zip", "deflate", 1),
+                ("zip", "auto", 1),
+                ("tar", "store", 1),
+            ]
+            if threads_count > 1:
+                archive_variants.insert(2, ("zip", "deflate", threads_count))
+            for archive_format, compression, threads in archive_variants:
+
+                def write_archive():
+                    archive_path = tmp_path / f"out.{archive_format}"
+                    archive_path.unlink(missing_ok=True)
+                    archive = main.open_archive(
+                        archive_path, archive_format, compression, None, threads
+                    )
+                    for file_name, source in save_paths:
+                        archive.add(file_name, source)
+                    archive.close()
+
+                benchmark = f"archive {archive_format} {compression}"
+                if threads > 1:
+                    benchmark += f" {threads} threads"
+                record(benchmark, size, best_time(write_archive, repeat))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the extractor benchmarks.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 1000, 100_000],
+        help="container counts to benchmark (default: 10 1000 100000)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--blob-size", type=int, default=4096)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 4,
+        help="threads of the parallel ZIP compression benchmark (default: CPU count)",
+    )
+    parser.add_argument("--json", type=Path, help="also write the results to a JSON file")
+    args = parser.parse_args()
+    results = run(args.sizes, args.repeat, args.blob_size, args.threads)
+    if args.json is not None:
+        with args.json.open("w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,175 @@
+import argparse
+import random
+import struct
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Tuple
+
+# Writes synthetic Xbox app "wgs" save trees (containers.index, container.N and GUID-named blobs)
+# that can be read with main.read_user_containers.
+
+filetime_epoch = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+
+def utf16_str(s: str) -> bytes:
+    return struct.pack("<i", len(s)) + s.encode("utf-16-le")
+
+
+def to_filetime(dt: datetime) -> int:
+    return int((dt - filetime_epoch).total_seconds() * 10_000_000)
+
+
+def write_container_index(
+    user_wgs_dir: Path,
+    store_pkg_name: str,
+    containers: List[Tuple[str, int, uuid.UUID]],
+    created: datetime | None = None,
+):
+    created = created or datetime.now(timezone.utc)
+    filetime = to_filetime(created)
+    out = bytearray()
+    out += struct.pack("<ii", 0x0E, len(containers))
+    out += utf16_str("")
+    out += utf16_str(f"{store_pkg_name}!App")
+    out += struct.pack("<Q4x", filetime)
+    out += utf16_str("1")
+    out += struct.pack("<8x")
+    for name, num, guid in containers:
+        out += utf16_str(name)
+        out += utf16_str(name)
+        out += utf16_str(f'"0x{num:016X}"')
+        out += struct.pack("<B4x16sQ16x", num, guid.bytes_le, filetime)
+    (user_wgs_dir / "containers.index").write_bytes(out)
+
+
+def write_container_file(
+    container_dir: Path, num: int, files: List[Tuple[str, uuid.UUID, uuid.UUID]]
+):
+    out = bytearray(struct.pack("<ii", 4, len(files)))
+    for name, guid, guid_2 in files:
+        out += struct.pack(
+            "<128s16s16s", name.encode("utf-16-le"), guid.bytes_le, guid_2.bytes_le
+        )
+    (container_dir / f"container.{num}").write_bytes(out)
+
+
+def container_layout(
+    handler: str, i: int, files_per_container: int
+) -> Tuple[str, List[str]]:
+    # Container and file names that the given games.json handler expects
+    generic_files = [f"file{j}" for j in range(files_per_container)]
+    if handler == "starfield":
+        return (
+            f"Saves/Save{i}.sfs",
+            ["toc"] + [f"BlobData{j}" for j in range(files_per_container)],
+        )
+    if handler == "like-a-dragon":
+        return (f"slot{i}/datasav", ["data", "icon"])
+    if handler == "cricket-24":
+        return (f"folder{i}", [f"file{j}.CHUNK0" for j in range(files_per_container)])
+    if handler == "railway-empire-2":
+        return (f"save{i}", ["savegame", "description"])
+    if handler == "lies-of-p":
+        # The handler strips the leading digits, the names must differ after them
+        return (f"{i}SaveData{i:04d}", generic_files)
+    if handler == "palworld":
+        return (f"{i:032X}-Level", generic_files)
+    if handler == "coral-island":
+        return (f"{'Backup' if i % 2 else ''}Slot{i}", generic_files)
+    return (f"container{i}", generic_files)
+
+
+def generate(
+    user_wgs_dir: Path,
+    store_pkg_name: str = "Synthetic.Game_0000000000000",
+    container_count: int = 10,
+    files_per_container: int = 1,
+    blob_size: int = 1024,
+    handler: str = "1c1f",
+    mismatch_ratio: float = 0.0,
+    missing_ratio: float = 0.0,
+    seed: int = 0,
+) -> Path:
+    # mismatch_ratio: share of file entries whose two GUIDs differ. Half of them have only the
+    # second file on disk, the other half have both (a conflict).
+    # missing_ratio: share of file entries without a file on disk.
+    rng = random.Random(seed)
+    user_wgs_dir.mkdir(parents=True, exist_ok=True)
+    index_entries = []
+    for i in range(container_count):
+        guid = uuid.UUID(int=rng.getrandbits(128), version=4)
+        num = 1 + i % 255
+        container_dir = user_wgs_dir / guid.hex.upper()
+        container_dir.mkdir()
+        container_name, file_names = container_layout(handler, i, files_per_container)
+        files = []
+        for file_name in file_names:
+            file_guid = uuid.UUID(int=rng.getrandbits(128), version=4)
+            file_guid_2 = file_guid
+            roll = rng.random()
+            if roll < missing_ratio:
+                files.append((file_name, file_guid, file_guid_2))
+                continue
+            blob = rng.randbytes(blob_size)
+            if roll < missing_ratio + mismatch_ratio:
+                file_guid_2 = uuid.UUID(int=rng.getrandbits(128), version=4)
+                (container_dir / file_guid_2.hex.upper()).write_bytes(blob)
+                if rng.random() < 0.5:
+                    # The other file of a conflict has different data
+                    other_blob = rng.randbytes(blob_size)
+                    (container_dir / file_guid.hex.upper()).write_bytes(other_blob)
+            else:
+                (container_dir / file_guid.hex.upper()).write_bytes(blob)
+            files.append((file_name, file_guid, file_guid_2))
+        write_container_file(container_dir, num, files)
+        index_entries.append((container_name, num, guid))
+    write_container_index(user_wgs_dir, store_pkg_name, index_entries)
+    return user_wgs_dir
+
+
+def generate_packages_root(
+    packages_root: Path,
+    games: List[Tuple[str, str]],
+    users: int = 1,
+    unrelated_packages: int = 0,
+    **kwargs,
+) -> Path:
+    # Create a Packages directory with a wgs tree per (package, handler) and user,
+    # plus unrelated package directories like on a real profile
+    for pkg_name, handler in games:
+        wgs_dir = packages_root / pkg_name / "SystemAppData/wgs"
+        for u in range(users):
+            user_dir = wgs_dir / f"{0x0009000000000000 + u:016X}_{0:032X}"
+            generate(user_dir, pkg_name, handler=handler, seed=u, **kwargs)
+        (wgs_dir / "t").mkdir()
+    for i in range(unrelated_packages):
+        (packages_root / f"Unrelated.Package{i}_0000000000000").mkdir(parents=True)
+    return packages_root
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic wgs save tree for one user."
+    )
+    parser.add_argument("output", type=Path, help="user wgs directory to create")
+    parser.add_argument("--package", default="Synthetic.Game_0000000000000")
+    parser.add_argument("--handler", default="1c1f")
+    parser.add_argument("--containers", type=int, default=10)
+    parser.add_argument("--files-per-container", type=int, default=1)
+    parser.add_argument("--blob-size", type=int, default=1024)
+    parser.add_argument("--mismatch-ratio", type=float, default=0.0)
+    parser.add_argument("--missing-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(
+        args.output,
+        args.package,
+        container_count=args.containers,
+        files_per_container=args.files_per_container,
+        blob_size=args.blob_size,
+        handler=args.handler,
+        mismatch_ratio=args.mismatch_ratio,
+        missing_ratio=args.missing_ratio,
+        seed=args.seed,
+    )
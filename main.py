@@ -1,14 +1,38 @@
+import argparse
+import collections
+import contextlib
+import cProfile
+import ctypes
+import errno
+import functools
+import hashlib
+import importlib.metadata
+import io
+import itertools
 import json
+import marshal
 import os
+import re
+import select
+import shutil
 import struct
 import sys
-import tempfile
+import tarfile
+import threading
+import time
 import traceback
 import uuid
 import zipfile
+import zlib
 from datetime import datetime, timedelta, timezone
 from pathlib import Path, PurePath
-from typing import Any, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Xbox Game Pass for PC savefile extractor
 
@@ -17,67 +41,1523 @@ from typing import Any, Dict, List, Tuple
 # Thanks to @snoozbuster for figuring out the container format at https://github.com/goatfungus/NMSSaveEditor/issues/306
 
 filetime_epoch = datetime(1601, 1, 1, tzinfo=timezone.utc)
-packages_root = Path(os.path.expandvars(f"%LOCALAPPDATA%\\Packages"))
+default_packages_root = Path(os.path.expandvars(f"%LOCALAPPDATA%\\Packages"))
+
+# Exit statuses
+EXIT_OK = 0
+# Fatal error, e.g. invalid games.json or missing packages directory
+EXIT_ERROR = 1
+# Invalid command line arguments
+EXIT_USAGE = 2
+# No supported games or saves were found
+EXIT_NOTHING_FOUND = 3
+# Extracting the saves failed for some games or users
+EXIT_PARTIAL_FAILURE = 4
+
+# Wait for enter on prompts and before quitting. Enabled by main() unless --non-interactive
+# is given, so that the functions can be used as a library without prompts.
+interactive = False
+
+
+class GameListError(Exception):
+    pass
+
+
+class GameList(dict):
+    # Supported games keyed by package name, with indexes for the other lookups
+
+    def __init__(self, games: Dict[str, Dict[str, Any]]):
+        super().__init__(games)
+        self.by_name: Dict[str, str] = {}
+        self.by_handler: Dict[str, List[str]] = {}
+        self.handlers: Dict[str, SaveHandler] = {}
+        for pkg_name, game in games.items():
+            self.by_name[game["name"].lower()] = pkg_name
+            self.by_handler.setdefault(game["handler"], []).append(pkg_name)
+
+    def handler(self, pkg_name: str) -> "SaveHandler":
+        # Handlers are built once per game with their arguments already validated
+        handler = self.handlers.get(pkg_name)
+        if handler is None:
+            if pkg_name not in self:
+                raise Exception('Unsupported XGP app "%s"' % pkg_name)
+            game = self[pkg_name]
+            handler_class = get_handler_class(game["handler"])
+            if handler_class is None:
+                raise Exception(f'Unknown handler "{game["handler"]}" for "{pkg_name}"')
+            handler = handler_class(game["handler_args"])
+            self.handlers[pkg_name] = handler
+        return handler
+
+    def find(self, name_or_package: str) -> str | None:
+        # Look up a package name by game name or package name, case-insensitively
+        if name_or_package in self:
+            return name_or_package
+        lowered = name_or_package.lower()
+        for pkg_name in self:
+            if pkg_name.lower() == lowered:
+                return pkg_name
+        return self.by_name.get(lowered)
+
+
+# Version of the compiled games.json cache format
+GAME_LIST_CACHE_VERSION = 1
+
+
+def parse_game_list(text: str) -> Dict[str, Dict[str, Any]]:
+    # Blank out comment lines instead of removing them to keep line numbers in errors correct
+    without_comments = "\n".join(
+        ["" if l.lstrip().startswith("//") else l for l in text.splitlines()]
+    )
+    try:
+        j = json.loads(without_comments)
+    except json.JSONDecodeError as e:
+        raise GameListError(f"line {e.lineno} column {e.colno}: {e.msg}") from e
+
+    if not isinstance(j, dict) or not isinstance(j.get("games"), list):
+        raise GameListError('expected an object with a "games" list')
+
+    # Create a dict with the package name as the key
+    games: Dict[str, Dict[str, Any]] = {}
+    for i, entry in enumerate(j["games"]):
+        if not isinstance(entry, dict):
+            raise GameListError(f"entry {i}: expected an object")
+        label = f'entry {i} ("{entry.get("name", entry.get("package"))}")'
+        for key in ("name", "package", "handler"):
+            if not isinstance(entry.get(key), str) or not entry[key]:
+                raise GameListError(f'{label}: "{key}" must be a non-empty string')
+        handler_class = get_handler_class(entry["handler"])
+        if handler_class is None:
+            raise GameListError(f'{label}: unknown handler "{entry["handler"]}"')
+        handler_args = entry.get("handler_args") or {}
+        if not isinstance(handler_args, dict):
+            raise GameListError(f'{label}: "handler_args" must be an object')
+        try:
+            handler_class(handler_args)
+        except ValueError as e:
+            raise GameListError(f"{label}: {e}") from e
+        if entry["package"] in games:
+            raise GameListError(f'{label}: duplicate package "{entry["package"]}"')
+        games[entry["package"]] = {
+            "name": entry["name"],
+            "handler": entry["handler"],
+            "handler_args": handler_args,
+        }
+    return games
+
+
+def read_game_list() -> GameList:
+    # Search for the games JSON in the script directory
+    games_json_path = Path("games.json")
+    if not games_json_path.exists():
+        # Search for the games JSON in the bundle directory
+        games_json_path = Path(__file__).resolve().with_name("games.json")
+    if not games_json_path.exists():
+        raise GameListError("games.json not found")
+
+    # The parsed and validated list is cached next to the JSON file. The cache is used when the JSON
+    # file has the same size and mtime, or the same content hash, as when the cache was written.
+    cache_path = games_json_path.with_name(games_json_path.name + ".cache")
+    st = games_json_path.stat()
+    cache = None
+    try:
+        with cache_path.open("rb") as f:
+            cache = marshal.load(f)
+        if cache.get("version") != GAME_LIST_CACHE_VERSION:
+            cache = None
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+        cache = None
+    if (
+        cache is not None
+        and cache["mtime_ns"] == st.st_mtime_ns
+        and cache["size"] == st.st_size
+    ):
+        return GameList(cache["games"])
+
+    data = games_json_path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if cache is not None and cache["sha256"] == digest:
+        games = cache["games"]
+    else:
+        try:
+            games = parse_game_list(data.decode("utf-8"))
+        except UnicodeDecodeError as e:
+            raise GameListError(f"not valid UTF-8: {e}") from e
+
+    try:
+        temp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with temp_path.open("wb") as f:
+            marshal.dump(
+                {
+                    "version": GAME_LIST_CACHE_VERSION,
+                    "mtime_ns": st.st_mtime_ns,
+                    "size": st.st_size,
+                    "sha256": digest,
+                    "games": games,
+                },
+                f,
+            )
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # The directory may be read-only (e.g. inside a bundle), the cache is optional
+        pass
+    return GameList(games)
+
+
+def discover_games(supported_games: Dict[str, Any], packages_root: Path) -> List[str]:
+    # List the Packages directory once instead of probing a path for every supported game
+    count("scandir_calls")
+    with os.scandir(packages_root) as it:
+        installed = {
+            entry.name
+            for entry in it
+            if entry.name in supported_games and entry.is_dir()
+        }
+    # Keep the order of games.json
+    return [pkg_name for pkg_name in supported_games if pkg_name in installed]
+
+
+def discover_games_in_roots(
+    supported_games: Dict[str, Any], packages_roots: List[Path]
+) -> List[Tuple[Path, str]]:
+    # Scan several Packages directories (e.g. mounted profile images) concurrently
+    if len(packages_roots) == 1:
+        found_per_root = [discover_games(supported_games, packages_roots[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(packages_roots)) as executor:
+            found_per_root = list(
+                executor.map(
+                    lambda root: discover_games(supported_games, root), packages_roots
+                )
+            )
+    return [
+        (packages_root, pkg_name)
+        for packages_root, found_games in zip(packages_roots, found_per_root)
+        for pkg_name in found_games
+    ]
+
+
+def packages_root_id(packages_root: Path) -> str:
+    # Short stable name of a Packages directory, keeps the exports of the same game and user
+    # in several --packages-root directories apart
+    return hashlib.sha1(os.fsencode(packages_root.resolve())).hexdigest()[:8]
+
+
+# Precompiled layouts for the container index and container files
+# Index header: unknown (4), container count
+INDEX_HEADER = struct.Struct("<4xi")
+# Creation date (FILETIME), unknown (4)
+INDEX_CREATION = struct.Struct("<Q4x")
+# Unknown (8)
+INDEX_PADDING = struct.Struct("<8x")
+# Container number, unknown (4), container (folder) GUID, creation date (FILETIME), unknown (16)
+INDEX_ENTRY = struct.Struct("<B4x16sQ16x")
+# Unknown (always 04 00 00 00 ?), file count
+CONTAINER_HEADER = struct.Struct("<4xi")
+# File name (0x80 (128) bytes UTF-16 = 64 characters), file GUID, copy of the file GUID
+CONTAINER_ENTRY = struct.Struct("<128s16s16s")
+STR_LEN = struct.Struct("<i")
+# Values of the unknown first fields, used when writing index and container files
+INDEX_VERSION = 0x0E
+CONTAINER_VERSION = 4
+
+
+def unpack_utf16_str(buf: bytes, offset: int) -> Tuple[str, int]:
+    # Length-prefixed UTF-16 string, returns the string and the offset after it
+    (str_len,) = STR_LEN.unpack_from(buf, offset)
+    offset += STR_LEN.size
+    end = offset + str_len * 2
+    if end > len(buf):
+        raise struct.error("string extends past the end of the buffer")
+    return buf[offset:end].decode("utf-16").rstrip("\0"), end
+
+
+def pack_utf16_str(s: str) -> bytes:
+    encoded = s.encode("utf-16-le")
+    return STR_LEN.pack(len(encoded) // 2) + encoded
+
+
+def filetime_to_datetime(filetime: int) -> datetime:
+    filetime_seconds = filetime / 10_000_000
+    return filetime_epoch + timedelta(seconds=filetime_seconds)
+
+
+def datetime_to_filetime(dt: datetime) -> int:
+    return (dt - filetime_epoch) // timedelta(microseconds=1) * 10
+
+
+class ContainerFile(NamedTuple):
+    # A file of a container, stored in the container directory with its GUID as the name
+    name: str
+    guid: uuid.UUID
+    path: Path
+    # The other GUID of the container file entry, usually the same as guid
+    other_guid: uuid.UUID
+
+    @property
+    def size(self) -> int:
+        count("stat_calls")
+        return self.path.stat().st_size
+
+
+class Container(NamedTuple):
+    name: str
+    number: int
+    guid: uuid.UUID
+    # Creation date from the container index, FILETIME
+    filetime: int
+    files: List[ContainerFile]
+
+    @property
+    def creation_date(self) -> datetime:
+        return filetime_to_datetime(self.filetime)
+
+
+# Default size of the chunks used when streaming save data into archives
+CHUNK_SIZE = 1024 * 1024
+# Threads used to write the files of a directory export when --threads isn't given
+DEFAULT_THREADS = 4
+
+
+class BufferBudget:
+    # Limits the memory held by the read buffers of all threads together. A reader waits
+    # until other readers have released enough of the budget.
+
+    def __init__(self, limit: int | None = None):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size: int):
+        if self.limit is None:
+            return
+        with self.condition:
+            # A single buffer is always allowed, so that a reader can't wait forever
+            while self.used > 0 and self.used + size > self.limit:
+                self.condition.wait()
+            self.used += size
+
+    def try_acquire(self, size: int) -> bool:
+        # Like acquire(), but returns False instead of waiting
+        if self.limit is None:
+            return True
+        with self.condition:
+            if self.used > 0 and self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size: int):
+        if self.limit is None:
+            return
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+# Read buffer size and memory budget, set with --buffer-size and --max-memory
+buffer_size = CHUNK_SIZE
+buffer_budget = BufferBudget()
+
+
+def read_chunks(
+    f, chunk_size: int | None = None, limit: int | None = None
+) -> Iterator[bytes]:
+    # Read a binary file in chunks, up to limit bytes if given. Every read of save data goes
+    # through here, so at most one chunk per reader is in memory and all chunks together stay
+    # within buffer_budget. A chunk is held until the next one is requested.
+    chunk_size = chunk_size or buffer_size
+    while limit is None or limit > 0:
+        read_size = chunk_size if limit is None else min(chunk_size, limit)
+        buffer_budget.acquire(read_size)
+        try:
+            chunk = f.read(read_size)
+            if not chunk:
+                return
+            if limit is not None:
+                limit -= len(chunk)
+            yield chunk
+        finally:
+            buffer_budget.release(read_size)
+
+
+class PaddedParts(NamedTuple):
+    # A virtual file that is made of the given parts concatenated in order,
+    # each part padded to the next 16 byte boundary with "padding\0".
+    parts: List[Path]
+
+
+class FileSlice(NamedTuple):
+    # A byte range of a file, used when a Steam/Epic save is split into container files
+    path: Path
+    offset: int
+    size: int
+
+
+# Handlers return the data of each output file either as a path to an existing file,
+# in-memory bytes or a virtual file made of parts that is assembled while it is written.
+# Importers also return slices of files.
+SaveSource = Path | bytes | PaddedParts | FileSlice
+
+PAD_BYTES = b"padding\0" * 2
+
+
+def source_paths(source: SaveSource) -> List[Path]:
+    # Files in the container directory that the source is read from
+    if isinstance(source, PaddedParts):
+        return source.parts
+    if isinstance(source, FileSlice):
+        return [source.path]
+    if isinstance(source, Path):
+        return [source]
+    return []
+
+
+def iter_source_chunks(source: SaveSource, chunk_size: int | None = None):
+    if isinstance(source, bytes):
+        yield source
+    elif isinstance(source, PaddedParts):
+        for part_path in source.parts:
+            size = 0
+            count("files_read")
+            with open(part_path, "rb", buffering=0) as part_f:
+                for chunk in read_chunks(part_f, chunk_size):
+                    size += len(chunk)
+                    yield chunk
+            count("bytes_read", size)
+            pad = 16 - (size % 16)
+            if pad != 16:
+                yield PAD_BYTES[:pad]
+    elif isinstance(source, FileSlice):
+        count("files_read")
+        with open(source.path, "rb", buffering=0) as f:
+            f.seek(source.offset)
+            for chunk in read_chunks(f, chunk_size, source.size):
+                count("bytes_read", len(chunk))
+                yield chunk
+    else:
+        count("files_read")
+        with open(source, "rb", buffering=0) as f:
+            for chunk in read_chunks(f, chunk_size):
+                count("bytes_read", len(chunk))
+                yield chunk
+
+
+def source_size(source: SaveSource) -> int:
+    if isinstance(source, bytes):
+        return len(source)
+    if isinstance(source, FileSlice):
+        return source.size
+    count("stat_calls", len(source_paths(source)))
+    if isinstance(source, PaddedParts):
+        return sum(-(-part_path.stat().st_size // 16) * 16 for part_path in source.parts)
+    return source.stat().st_size
+
+
+class SourceReader(io.RawIOBase):
+    # File-like view of a save source for APIs that read from file objects (e.g. tarfile)
+
+    def __init__(self, source: SaveSource):
+        self.chunks = iter_source_chunks(source)
+        self.pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.pending:
+            self.pending = memoryview(next(self.chunks, b""))
+            if not self.pending:
+                return 0
+        size = min(len(b), len(self.pending))
+        b[:size] = self.pending[:size]
+        # Slicing the view doesn't copy the rest of the chunk
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        self.chunks.close()
+        super().close()
+
+
+def source_mtime(source: SaveSource) -> datetime:
+    paths = source_paths(source)
+    if len(paths) == 0:
+        return datetime.now()
+    return datetime.fromtimestamp(max(p.stat().st_mtime for p in paths))
+
+
+# Archive compression methods, "auto" stores entries that do not compress well with DEFLATE
+ZIP_COMPRESSION_METHODS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+    "auto": zipfile.ZIP_DEFLATED,
+}
+if hasattr(zipfile, "ZIP_ZSTANDARD"):
+    # Python 3.14+
+    ZIP_COMPRESSION_METHODS["zstd"] = zipfile.ZIP_ZSTANDARD
+
+TAR_COMPRESSION_SUFFIXES = {
+    "store": "",
+    "deflate": "gz",
+    "bzip2": "bz2",
+    "lzma": "xz",
+}
+COMPRESSION_CHOICES = ["store", "deflate", "bzip2", "lzma", "zstd", "auto"]
+# Accepted --compression-level values of each compression (lzma levels are xz presets)
+COMPRESSION_LEVELS = {
+    "deflate": (0, 9),
+    "auto": (0, 9),
+    "bzip2": (1, 9),
+    "lzma": (0, 9),
+    "zstd": (1, 22),
+}
+
+# Amount of data that is compressed to decide whether an entry is worth compressing in "auto" mode
+AUTO_SAMPLE_SIZE = 16 * 1024
+# Entries that compress worse than this ratio are stored
+AUTO_MIN_RATIO = 0.9
+# Each deflate block is compressed with this much of the preceding data as the dictionary
+DEFLATE_WINDOW = 32 * 1024
+# Empty deflate block with the final block flag that ends the blocks of an entry
+DEFLATE_FINAL_BLOCK = zlib.compressobj(9, zlib.DEFLATED, -15).flush()
+
+
+def deflate_block(data: bytes, zdict: bytes, level: int) -> bytes:
+    # Compress one block of a raw deflate stream. The blocks of an entry can be compressed
+    # independently and concatenated in order (like pigz does): every block ends on a byte
+    # boundary without the final block flag, DEFLATE_FINAL_BLOCK follows the last one. zlib
+    # releases the GIL while compressing, so blocks are compressed in parallel in threads.
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ExportJournal:
+    # Entries committed to a partial archive, one JSON object per line in a file next to it.
+    # An interrupted export is resumed from the journal by skipping the committed entries.
+
+    def __init__(self, partial_path: Path, archive_format: str, compression: str):
+        self.path = partial_path.with_name(partial_path.name + ".journal")
+        self.header = {
+            "version": 1,
+            "format": archive_format,
+            "compression": compression,
+        }
+        self.lock = threading.Lock()
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.file = None
+
+    def load(self) -> bool:
+        # Read the committed entries, returns False when there is no usable journal
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return False
+        try:
+            if len(lines) == 0 or json.loads(lines[0]) != self.header:
+                return False
+        except ValueError:
+            return False
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line can be incomplete when the export was interrupted
+                break
+            self.records[record.pop("name")] = record
+        return True
+
+    def open(self):
+        if len(self.records) > 0:
+            self.file = self.path.open("a", encoding="utf-8")
+            return
+        self.file = self.path.open("w", encoding="utf-8")
+        self.file.write(json.dumps(self.header) + "\n")
+        self.file.flush()
+
+    def commit(self, name: str, record: Dict[str, Any]):
+        # Called by the archive writers when the data of an entry has been written out
+        with self.lock:
+            self.records[name] = record
+            self.file.write(json.dumps({"name": name, **record}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def resume_offset(journal: ExportJournal | None) -> int | None:
+    # End of the last committed entry of a partial archive, None when starting from scratch
+    if journal is None or len(journal.records) == 0:
+        return None
+    return max(record["end"] for record in journal.records.values())
+
+
+def open_for_resume(path: Path, offset: int):
+    # Open a partial archive for writing after its last committed entry
+    f = open(path, "r+b")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+# ZipInfo attributes kept in the journal to rebuild the central directory when resuming
+ZIPINFO_JOURNAL_FIELDS = [
+    "compress_type",
+    "_compresslevel",
+    "create_system",
+    "create_version",
+    "extract_version",
+    "reserved",
+    "flag_bits",
+    "volume",
+    "internal_attr",
+    "external_attr",
+    "header_offset",
+    "CRC",
+    "compress_size",
+    "file_size",
+]
+
+
+class ZipArchiveWriter:
+    def __init__(
+        self,
+        path: Path,
+        compression: str,
+        level: int | None,
+        journal: ExportJournal | None = None,
+        threads: int = 1,
+    ):
+        if compression not in ZIP_COMPRESSION_METHODS:
+            raise ValueError(
+                f'Compression "{compression}" is not available for ZIP archives with this Python version'
+            )
+        self.auto = compression == "auto"
+        self.journal = journal
+        self.file = None
+        # With more than one thread, deflated entries are split into blocks that are
+        # compressed by a thread pool and written in order. The queue holds the header,
+        # blocks and end of each entry that is not written yet. The chunks of queued blocks
+        # are counted in buffer_budget until they are written.
+        self.executor = None
+        self.pending = collections.deque()
+        self.max_pending = threads * 2
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        # Entry whose blocks are being written
+        self.current = None
+        self.zip64 = False
+        if threads > 1 and ZIP_COMPRESSION_METHODS[compression] == zipfile.ZIP_DEFLATED:
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+        offset = resume_offset(journal)
+        if offset is None:
+            self.zip = zipfile.ZipFile(
+                path, "x", ZIP_COMPRESSION_METHODS[compression], compresslevel=level
+            )
+            return
+        # The local headers and data of the committed entries are kept, the central directory
+        # is rebuilt from the journal when the archive is closed
+        self.file = open_for_resume(path, offset)
+        self.zip = zipfile.ZipFile(
+            self.file, "w", ZIP_COMPRESSION_METHODS[compression], compresslevel=level
+        )
+        for name, record in journal.records.items():
+            zinfo = zipfile.ZipInfo(name, tuple(record["date_time"]))
+            zinfo.extra = bytes.fromhex(record["extra"])
+            for field in ZIPINFO_JOURNAL_FIELDS:
+                setattr(zinfo, field, record[field])
+            self.zip.filelist.append(zinfo)
+            self.zip.NameToInfo[name] = zinfo
+
+    def add(self, arcname: str, source: SaveSource, mtime: float | None = None):
+        # Stream the source into the archive without staging it on disk
+        arcname = os.fspath(arcname)
+        if isinstance(source, Path):
+            zinfo = zipfile.ZipInfo.from_file(source, arcname)
+            count("stat_calls")
+        else:
+            zinfo = zipfile.ZipInfo(arcname, datetime.now().timetuple()[:6])
+            zinfo.external_attr = 0o644 << 16
+            zinfo.file_size = source_size(source)
+        if mtime is not None:
+            zinfo.date_time = datetime.fromtimestamp(mtime).timetuple()[:6]
+        zinfo.compress_type = self.zip.compression
+        zinfo._compresslevel = self.zip.compresslevel
+        chunks = iter_source_chunks(source)
+        first_chunk = next(chunks, b"")
+        if self.auto:
+            # Sample the start of the first chunk instead of reading the source twice
+            sample = first_chunk[:AUTO_SAMPLE_SIZE]
+            if len(zlib.compress(sample, 1)) > len(sample) * AUTO_MIN_RATIO:
+                zinfo.compress_type = zipfile.ZIP_STORED
+        if self.executor is not None and zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            self.add_blocks(arcname, zinfo, itertools.chain([first_chunk], chunks))
+            return
+        # Entries are written in order, so the queued ones go first
+        self.write_pending()
+        with self.zip.open(zinfo, "w") as dest:
+            dest.write(first_chunk)
+            for chunk in chunks:
+                dest.write(chunk)
+        self.commit(arcname, zinfo)
+
+    def add_blocks(self, arcname: str, zinfo: zipfile.ZipInfo, chunks: Iterator[bytes]):
+        self.pending.append(("header", zinfo, None))
+        try:
+            zdict = b""
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                reserved = self.reserve(len(chunk))
+                future = self.executor.submit(deflate_block, chunk, zdict, self.level)
+                self.pending.append(("block", future, (chunk, reserved)))
+                # A block without a reservation is written right away
+                self.write_pending(self.max_pending if reserved > 0 else 0)
+                zdict = chunk[-DEFLATE_WINDOW:]
+        except BaseException:
+            # Drop the queued part of the incomplete entry, the central directory is written
+            # over what has been written of it
+            while len(self.pending) > 0:
+                kind, _, data = self.pending.pop()
+                if kind == "header":
+                    break
+                if kind == "block":
+                    buffer_budget.release(data[1])
+            raise
+        self.pending.append(("end", zinfo, arcname))
+
+    def reserve(self, size: int) -> int:
+        # Reserve the budget for a queued block without waiting, so that the queue can't wait
+        # for its own chunks: the oldest queued items are written while there's no room.
+        # Returns 0 if nothing is queued and there's still no room.
+        while not buffer_budget.try_acquire(size):
+            if not any(kind == "block" for kind, _, _ in self.pending):
+                return 0
+            self.write_pending(len(self.pending) - 1)
+        return size
+
+    def write_pending(self, max_pending: int = 0):
+        # Write the queued entries up to the last max_pending items, like ZipFile.open() and
+        # _ZipWriteFile would: the local header is written first and rewritten with the CRC
+        # and sizes when the data has been written
+        fp = self.zip.fp
+        while len(self.pending) > max_pending:
+            kind, item, data = self.pending.popleft()
+            if kind == "header":
+                zinfo = item
+                # Compressed size can be larger than uncompressed size
+                self.zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+                zinfo.CRC = 0
+                zinfo.compress_size = 0
+                zinfo.file_size = 0
+                fp.seek(self.zip.start_dir)
+                zinfo.header_offset = fp.tell()
+                self.zip._writecheck(zinfo)
+                self.zip._didModify = True
+                fp.write(zinfo.FileHeader(self.zip64))
+                self.current = zinfo
+            elif kind == "block":
+                chunk, reserved = data
+                try:
+                    compressed = item.result()
+                finally:
+                    buffer_budget.release(reserved)
+                self.current.CRC = zlib.crc32(chunk, self.current.CRC)
+                self.current.file_size += len(chunk)
+                self.current.compress_size += len(compressed)
+                fp.write(compressed)
+            else:
+                zinfo = item
+                fp.write(DEFLATE_FINAL_BLOCK)
+                zinfo.compress_size += len(DEFLATE_FINAL_BLOCK)
+                size = max(zinfo.file_size, zinfo.compress_size)
+                if not self.zip64 and size > zipfile.ZIP64_LIMIT:
+                    raise RuntimeError("File size too large, try using force_zip64")
+                end = fp.tell()
+                fp.seek(zinfo.header_offset)
+                fp.write(zinfo.FileHeader(self.zip64))
+                fp.seek(end)
+                self.zip.start_dir = end
+                self.zip.filelist.append(zinfo)
+                self.zip.NameToInfo[zinfo.filename] = zinfo
+                self.commit(data, zinfo)
+
+    def commit(self, arcname: str, zinfo: zipfile.ZipInfo):
+        if self.journal is not None:
+            self.zip.fp.flush()
+            record = {field: getattr(zinfo, field) for field in ZIPINFO_JOURNAL_FIELDS}
+            record["date_time"] = zinfo.date_time
+            record["extra"] = zinfo.extra.hex()
+            record["end"] = self.zip.start_dir
+            self.journal.commit(arcname, record)
+
+    def close(self):
+        try:
+            self.write_pending()
+        except BaseException:
+            # Don't write the rest of the queue after a failed entry
+            for kind, _, data in self.pending:
+                if kind == "block":
+                    buffer_budget.release(data[1])
+            self.pending.clear()
+            raise
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+        self.zip.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class TarArchiveWriter:
+    def __init__(
+        self,
+        path: Path,
+        compression: str,
+        level: int | None,
+        journal: ExportJournal | None = None,
+    ):
+        self.raw_file = None
+        self.zstd_writer = None
+        # Only uncompressed tar files can be resumed
+        self.journal = journal if compression == "store" else None
+        offset = resume_offset(self.journal)
+        if compression == "zstd":
+            if zstandard is None:
+                raise ValueError(
+                    'Compression "zstd" for tar archives requires the "zstandard" package'
+                )
+            self.raw_file = open(path, "xb")
+            self.zstd_writer = zstandard.ZstdCompressor(
+                level=level if level is not None else 3
+            ).stream_writer(self.raw_file)
+            self.tar = tarfile.open(fileobj=self.zstd_writer, mode="w|")
+        elif offset is not None:
+            self.raw_file = open_for_resume(path, offset)
+            self.tar = tarfile.open(fileobj=self.raw_file, mode="w")
+        elif compression in TAR_COMPRESSION_SUFFIXES:
+            suffix = TAR_COMPRESSION_SUFFIXES[compression]
+            kwargs = {}
+            if level is not None and suffix in ("gz", "bz2"):
+                kwargs["compresslevel"] = level
+            elif level is not None and suffix == "xz":
+                kwargs["preset"] = level
+            self.tar = tarfile.open(path, f"x:{suffix}", **kwargs)
+        else:
+            raise ValueError(f'Compression "{compression}" is not available for tar archives')
+
+    def add(self, arcname: str, source: SaveSource, mtime: float | None = None):
+        tarinfo = tarfile.TarInfo(PurePath(arcname).as_posix())
+        tarinfo.size = source_size(source)
+        if mtime is None:
+            mtime = source_mtime(source).timestamp()
+        tarinfo.mtime = int(mtime)
+        tarinfo.mode = 0o644
+        with SourceReader(source) as reader:
+            self.tar.addfile(tarinfo, io.BufferedReader(reader, buffer_size))
+        if self.journal is not None:
+            self.tar.fileobj.flush()
+            self.journal.commit(arcname, {"end": self.tar.offset})
+
+    def close(self):
+        self.tar.close()
+        if self.zstd_writer is not None:
+            self.zstd_writer.close()
+        elif self.raw_file is not None:
+            self.raw_file.close()
+
+
+# Largest amount of data that is copied with one copy_file_range/sendfile call
+COPY_RANGE_MAX = 1024 * 1024 * 1024
+
+
+def copy_file_data(src_f, dest_f) -> int:
+    # Copy the rest of src_f to dest_f in the kernel when possible (copy_file_range, sendfile),
+    # otherwise in fixed-size chunks. Returns the number of bytes copied.
+    copied = 0
+    src_fd = src_f.fileno()
+    dest_fd = dest_f.fileno()
+    dest_f.flush()
+    if hasattr(os, "copy_file_range"):
+        try:
+            while n := os.copy_file_range(src_fd, dest_fd, COPY_RANGE_MAX):
+                copied += n
+            return copied
+        except OSError as e:
+            # E.g. copying between file systems on older kernels, fall back to sendfile
+            if copied > 0 or e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+                errno.EPERM,
+            ):
+                raise
+    if sys.platform.startswith("linux"):
+        try:
+            while n := os.sendfile(dest_fd, src_fd, None, COPY_RANGE_MAX):
+                copied += n
+            return copied
+        except OSError as e:
+            if copied > 0 or e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+    for chunk in read_chunks(src_f):
+        dest_f.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def write_source_file(dest: Path, source: SaveSource, mtime: float | None = None):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(source, Path):
+        count("files_read")
+        shutil.copy2(source, dest)
+    else:
+        with dest.open("xb") as dest_f:
+            if isinstance(source, bytes):
+                dest_f.write(source)
+            elif isinstance(source, FileSlice):
+                for chunk in iter_source_chunks(source):
+                    dest_f.write(chunk)
+            else:
+                for part_path in source.parts:
+                    count("files_read")
+                    with open(part_path, "rb") as part_f:
+                        size = copy_file_data(part_f, dest_f)
+                    count("bytes_read", size)
+                    pad = 16 - (size % 16)
+                    if pad != 16:
+                        dest_f.write(PAD_BYTES[:pad])
+    if mtime is not None:
+        os.utime(dest, (mtime, mtime))
+
+
+class DirectoryArchiveWriter:
+    # Writes the save files into a directory instead of an archive. The files are written
+    # concurrently, and files made of parts (Starfield saves) are copied part by part without
+    # reading the data into Python.
+
+    def __init__(
+        self, path: Path, threads: int, journal: ExportJournal | None = None
+    ):
+        self.resuming = journal is not None and len(journal.records) > 0
+        path.mkdir(parents=True, exist_ok=self.resuming)
+        self.root = path
+        self.journal = journal
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        # At most two files per thread are queued, so that add() follows the writing progress
+        self.max_pending = threads * 2
+        self.pending = collections.deque()
+        # Names of the files written so far, two threads must never write the same file
+        self.names = set()
+
+    def write_file(
+        self, arcname: str, dest: Path, source: SaveSource, mtime: float | None
+    ):
+        if self.resuming:
+            # A file that wasn't committed may have been partially written
+            dest.unlink(missing_ok=True)
+        write_source_file(dest, source, mtime)
+        if self.journal is not None:
+            self.journal.commit(arcname, {})
+
+    def add(self, arcname: str, source: SaveSource, mtime: float | None = None):
+        rel_path = PurePath(arcname)
+        if rel_path.is_absolute() or ".." in rel_path.parts:
+            raise ValueError(f'Unsafe file name "{arcname}"')
+        if rel_path in self.names:
+            raise ValueError(f'Duplicate file name "{arcname}"')
+        self.names.add(rel_path)
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(
+            self.executor.submit(
+                self.write_file, arcname, self.root / rel_path, source, mtime
+            )
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for future in self.pending:
+            future.result()
+
+
+# Directory next to the content-addressed manifests that holds the save file blobs
+STORE_OBJECTS_DIR = "objects"
+
+
+class ContentStoreWriter:
+    # Writes every save file once into a content-addressed store (objects/<sha256[:2]>/<sha256>
+    # next to the manifest) and lists the files of the export in a JSON manifest. Identical
+    # files of other users, runs and packages roots are not stored again.
+
+    def __init__(self, path: Path, journal: ExportJournal | None = None):
+        self.path = path
+        self.objects_dir = path.parent / STORE_OBJECTS_DIR
+        self.journal = journal
+        self.files: List[Dict[str, Any]] = []
+        if journal is not None and len(journal.records) > 0:
+            # The objects of the committed files are already in the store
+            self.files = [record["file"] for record in journal.records.values()]
+            return
+        # Reserve the manifest name, it is written when the export is complete
+        path.open("x").close()
+
+    def add(self, arcname: str, source: SaveSource, mtime: float | None = None):
+        digest, size = self.write_object(source)
+        if mtime is None:
+            mtime = source_mtime(source).timestamp()
+        file = {
+            "name": PurePath(arcname).as_posix(),
+            "sha256": digest,
+            "size": size,
+            "mtime": mtime,
+        }
+        self.files.append(file)
+        if self.journal is not None:
+            self.journal.commit(arcname, {"file": file})
+
+    def write_object(self, source: SaveSource) -> Tuple[str, int]:
+        # Hash the data while writing it into a temporary file, so that the source is read
+        # once. The file is dropped when the store already has the object. Returns the
+        # SHA-256 and size of the data.
+        hasher = hashlib.sha256()
+        temp_path = self.objects_dir / f"{uuid.uuid4().hex}.tmp"
+        temp_path.parent.mkdir(parents=True, exist_ok=True)
+        size = 0
+        try:
+            with temp_path.open("xb") as f:
+                for chunk in iter_source_chunks(source):
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            count("bytes_written", size)
+            digest = hasher.hexdigest()
+            object_path = self.objects_dir / digest[:2] / digest
+            count("stat_calls")
+            if object_path.is_file():
+                temp_path.unlink()
+                count("objects_reused")
+                return (digest, size)
+            object_path.parent.mkdir(exist_ok=True)
+            os.replace(temp_path, object_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        count("objects_written")
+        return (digest, size)
+
+    def close(self):
+        with self.path.open("w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.files}, f, indent=1)
+
+
+def read_store_manifest(manifest_path: Path) -> List[Tuple[str, Path, float]]:
+    # (file name, object path, mtime) of every file listed in a content-addressed manifest
+    with manifest_path.open("r", encoding="utf-8") as f:
+        files = json.load(f)["files"]
+    objects_dir = manifest_path.parent / STORE_OBJECTS_DIR
+    return [
+        (file["name"], objects_dir / file["sha256"][:2] / file["sha256"], file["mtime"])
+        for file in files
+    ]
+
+
+def archive_extension(archive_format: str, compression: str) -> str:
+    if archive_format == "cas":
+        return ".json"
+    if archive_format == "dir":
+        return ""
+    if archive_format == "zip":
+        return ".zip"
+    if compression == "zstd":
+        return ".tar.zst"
+    suffix = TAR_COMPRESSION_SUFFIXES.get(compression)
+    return f".tar.{suffix}" if suffix else ".tar"
+
+
+def open_archive(
+    path: Path,
+    archive_format: str,
+    compression: str,
+    level: int | None,
+    threads: int | None = None,
+    journal: ExportJournal | None = None,
+) -> (
+    ZipArchiveWriter | TarArchiveWriter | DirectoryArchiveWriter | ContentStoreWriter
+):
+    if archive_format == "cas":
+        return ContentStoreWriter(path, journal)
+    if archive_format == "dir":
+        return DirectoryArchiveWriter(path, threads or DEFAULT_THREADS, journal)
+    if archive_format == "zip":
+        # ZIP entries are only compressed in blocks when a thread count is given, otherwise
+        # they are written by ZipFile.open()
+        return ZipArchiveWriter(path, compression, level, journal, threads or 1)
+    return TarArchiveWriter(path, compression, level, journal)
+
+
+def can_resume(archive_format: str, compression: str) -> bool:
+    # Compressed tar streams can't be continued
+    return archive_format != "tar" or compression == "store"
+
+
+def archive_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(
+            entry.stat().st_size for entry in path.rglob("*") if entry.is_file()
+        )
+    return path.stat().st_size
+
+
+def remove_archive(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class ExportProgress:
+    # Reports the files and bytes written by an export, the throughput and the estimated
+    # time left on stderr, at most once per interval
+
+    def __init__(
+        self, label: str, total_files: int, total_bytes: int, interval: float = 1.0
+    ):
+        self.label = label
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        # Bytes of entries that were already written by an interrupted export
+        self.skipped_bytes = 0
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    def advance(self, files: int, size: int, skipped: bool = False):
+        self.files += files
+        self.bytes += size
+        if skipped:
+            self.skipped_bytes += size
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report(now)
+
+    def finish(self):
+        self.report(time.perf_counter())
+
+    def report(self, now: float):
+        elapsed = now - self.started
+        rate = (self.bytes - self.skipped_bytes) / elapsed if elapsed > 0 else 0.0
+        eta = "?"
+        if rate > 0:
+            eta = str(timedelta(seconds=round((self.total_bytes - self.bytes) / rate)))
+        mib = 1024 * 1024
+        print(
+            f"  {self.label}: {self.files}/{self.total_files} files, "
+            f"{self.bytes / mib:.1f}/{self.total_bytes / mib:.1f} MiB, "
+            f"{rate / mib:.1f} MiB/s, ETA {eta}",
+            file=sys.stderr,
+            flush=True,
+        )
 
 
-def read_game_list() -> Dict[str, Any] | None:
+# Archives are written with this suffix added to the name and renamed when they are complete
+PARTIAL_SUFFIX = ".partial"
+# Partial archives that are being written by this process
+active_exports = set()
+active_exports_lock = threading.Lock()
+
+
+def export(
+    saves: Iterable[Tuple],
+    path: Path,
+    archive_format: str = "zip",
+    compression: str = "deflate",
+    compression_level: int | None = None,
+    threads: int | None = None,
+    resume: bool = False,
+    progress: ExportProgress | None = None,
+) -> Path:
+    # Write (file name, source) pairs, or (file name, source, mtime) triples, into an archive
+    # and return its path. The archive is written to "<name>.partial" and renamed when it is
+    # complete. A "_N" suffix is added to the name when the archive already exists.
+    # With resume, the written entries are recorded in a journal and the partial archive is
+    # kept when writing fails. Exporting to the same path again continues the partial archive
+    # and skips the entries that it already has. Otherwise a partial archive is removed.
+    archive_ext = archive_extension(archive_format, compression)
+    archive_stem = path.name.removesuffix(archive_ext) if archive_ext else path.name
+    resume = resume and can_resume(archive_format, compression)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    archive_path = path
+    duplicate_num = 1
+    while True:
+        partial_path = archive_path.with_name(archive_path.name + PARTIAL_SUFFIX)
+        with active_exports_lock:
+            available = partial_path not in active_exports and not archive_path.exists()
+            if available:
+                active_exports.add(partial_path)
+        if available:
+            journal = None
+            if resume:
+                journal = ExportJournal(partial_path, archive_format, compression)
+                if journal.load() and (
+                    len(journal.records) == 0 or not partial_path.exists()
+                ):
+                    # Nothing to continue from
+                    remove_archive(partial_path)
+                    journal.remove()
+                    journal.records.clear()
+            try:
+                archive = open_archive(
+                    partial_path,
+                    archive_format,
+                    compression,
+                    compression_level,
+                    threads,
+                    journal,
+                )
+                break
+            except FileExistsError:
+                # E.g. a partial archive that was written without resume
+                with active_exports_lock:
+                    active_exports.discard(partial_path)
+        duplicate_num += 1
+        archive_path = path.with_name(f"{archive_stem}_{duplicate_num}{archive_ext}")
+
     try:
-        # Search for the games JSON in the script directory
-        games_json_path = Path("games.json")
-        if not games_json_path.exists():
-            # Search for the games JSON in the bundle directory
-            games_json_path = Path(__file__).resolve().with_name("games.json")
-        if not games_json_path.exists():
-            return None
-        with games_json_path.open("r") as f:
-            without_comments = "\n".join(
-                [l for l in f.readlines() if not l.lstrip().startswith("//")]
+        if journal is not None:
+            journal.open()
+        for entry in saves:
+            if journal is not None and entry[0] in journal.records:
+                if progress is not None:
+                    progress.advance(1, source_size(entry[1]), skipped=True)
+                continue
+            archive.add(*entry)
+            if progress is not None:
+                progress.advance(1, source_size(entry[1]))
+        archive.close()
+        os.replace(partial_path, archive_path)
+    except BaseException:
+        with contextlib.suppress(Exception):
+            archive.close()
+        if journal is not None:
+            journal.close()
+        else:
+            # Don't leave a partial archive behind
+            remove_archive(partial_path)
+        raise
+    finally:
+        with active_exports_lock:
+            active_exports.discard(partial_path)
+    if journal is not None:
+        journal.remove()
+    return archive_path
+
+
+def find_partial_export(output_dir: Path, prefix: str, archive_ext: str) -> Path | None:
+    # Path of the newest interrupted export named "<prefix><timestamp>[_N]<archive_ext>"
+    name_pattern = re.compile(
+        re.escape(prefix)
+        + r"\d{4}-\d\d-\d\d_\d\d_\d\d_\d\d(_\d+)?"
+        + re.escape(archive_ext + PARTIAL_SUFFIX)
+    )
+    candidates = []
+    try:
+        with os.scandir(output_dir) as it:
+            for entry in it:
+                if name_pattern.fullmatch(entry.name):
+                    candidates.append(entry.name.removesuffix(PARTIAL_SUFFIX))
+    except FileNotFoundError:
+        return None
+    if len(candidates) == 0:
+        return None
+    return output_dir / max(candidates)
+
+
+def source_digest(
+    source: SaveSource, algorithm: str = "sha256"
+) -> Tuple[int, int | str]:
+    # Size and CRC-32 (as stored in ZIP files) or SHA-256 of a save source, read once
+    size = 0
+    if algorithm == "crc32":
+        crc = 0
+        for chunk in iter_source_chunks(source):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+        return (size, crc)
+    hasher = hashlib.new(algorithm)
+    for chunk in iter_source_chunks(source):
+        hasher.update(chunk)
+        size += len(chunk)
+    return (size, hasher.hexdigest())
+
+
+def read_tar_digests(
+    path: Path, compression: str
+) -> List[Tuple[str, Tuple[int, str]]]:
+    # Name, size and SHA-256 of every file in a tar file in order, read in one pass
+    digests = []
+    with contextlib.ExitStack() as stack:
+        if compression == "zstd":
+            raw_file = stack.enter_context(path.open("rb"))
+            reader = stack.enter_context(
+                zstandard.ZstdDecompressor().stream_reader(raw_file)
             )
-        j = json.loads(without_comments)
-        # Create a dict with the package name as the key
-        games: Dict[str, Any] = {}
-        for entry in j["games"]:
-            games[entry["package"]] = {
-                "name": entry["name"],
-                "handler": entry["handler"],
-                "handler_args": entry.get("handler_args") or {}
+            tar = stack.enter_context(tarfile.open(fileobj=reader, mode="r|"))
+        else:
+            tar = stack.enter_context(tarfile.open(path, "r:*"))
+        for member in tar:
+            if not member.isfile():
+                continue
+            hasher = hashlib.sha256()
+            for chunk in read_chunks(tar.extractfile(member)):
+                hasher.update(chunk)
+            digests.append((member.name, (member.size, hasher.hexdigest())))
+    return digests
+
+
+class VerifyError(Exception):
+    pass
+
+
+def verify_export(
+    saves: Iterable[Tuple],
+    path: Path,
+    archive_format: str = "zip",
+    compression: str = "deflate",
+    threads: int = 4,
+    complete: bool = True,
+) -> List[str]:
+    # Compare (file name, source) pairs with an exported archive and return the differences.
+    # The sources are hashed in parallel, and compared with the CRC-32s of a ZIP file's
+    # central directory or the SHA-256s of a content-addressed manifest without reading the
+    # archived data. The files of tar files and directories are hashed too. Without complete,
+    # saves that are not in the archive are not reported (e.g. for incremental exports).
+    saves = [(PurePath(entry[0]).as_posix(), entry[1]) for entry in saves]
+    algorithm = "crc32" if archive_format == "zip" else "sha256"
+    problems = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        archive_digests = None
+        if archive_format == "tar":
+            archive_digests = executor.submit(read_tar_digests, path, compression)
+        digests = executor.map(
+            source_digest, [source for _, source in saves], itertools.repeat(algorithm)
+        )
+        if archive_format == "zip":
+            with zipfile.ZipFile(path) as zip_file:
+                entries = [
+                    (zinfo.filename, (zinfo.file_size, zinfo.CRC))
+                    for zinfo in zip_file.infolist()
+                    if not zinfo.is_dir()
+                ]
+        elif archive_format == "cas":
+            objects_dir = path.parent / STORE_OBJECTS_DIR
+            with path.open("r", encoding="utf-8") as f:
+                files = json.load(f)["files"]
+            entries = []
+            for file in files:
+                entries.append((file["name"], (file["size"], file["sha256"])))
+                object_path = objects_dir / file["sha256"][:2] / file["sha256"]
+                count("stat_calls")
+                if not object_path.is_file():
+                    problems.append(f'The data of "{file["name"]}" is missing')
+        elif archive_format == "dir":
+            file_paths = {
+                file_path.relative_to(path).as_posix(): file_path
+                for file_path in path.rglob("*")
+                if file_path.is_file()
             }
-        return games
-    except:
-        return None
+            entries = list(
+                zip(
+                    file_paths.keys(),
+                    executor.map(
+                        source_digest, file_paths.values(), itertools.repeat(algorithm)
+                    ),
+                )
+            )
+        else:
+            entries = archive_digests.result()
+
+        # A name can be in the archive more than once (e.g. the same file name in two
+        # containers), each save is matched with one of the archived files of its name
+        remaining = collections.Counter(entries)
+        archive_names = {name for name, _ in entries}
+        mismatched = set()
+        for (name, _), digest in zip(saves, digests):
+            if remaining[(name, digest)] > 0:
+                remaining[(name, digest)] -= 1
+            elif name in archive_names:
+                mismatched.add(name)
+                problems.append(f'"{name}" does not match the save data')
+            elif complete:
+                problems.append(f'"{name}" is missing')
+    extra = {name for (name, _), left in remaining.items() if left > 0} - mismatched
+    for name in sorted(extra):
+        problems.append(f'"{name}" is not a save file')
+    return problems
+
+
+# Output of the job running in the current thread is collected here when extracting in parallel
+job_output = threading.local()
+
+
+def log(*args, **kwargs):
+    buffer = getattr(job_output, "buffer", None)
+    if buffer is None:
+        print(*args, **kwargs)
+    else:
+        print(*args, file=buffer, **kwargs)
 
 
-def discover_games(supported_games: Dict[str, Any]) -> List[str]:
-    found_games = []
-    for pkg_name in supported_games.keys():
-        pkg_path = packages_root / pkg_name
-        if pkg_path.exists():
-            found_games.append(pkg_name)
-    return found_games
+def pause():
+    # Prompts would interleave when running parallel jobs, so only wait for enter on the main path
+    if interactive and getattr(job_output, "buffer", None) is None:
+        input()
 
 
-def read_utf16_str(f, str_len=None) -> str:
-    if not str_len:
-        str_len = struct.unpack("<i", f.read(4))[0]
-    return f.read(str_len * 2).decode("utf-16").rstrip("\0")
+class Metrics:
+    # Wall time and I/O counters of each extraction phase, per game and user
 
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
 
-def read_filetime(f) -> datetime:
-    filetime = struct.unpack("<Q", f.read(8))[0]
-    filetime_seconds = filetime / 10_000_000
-    return filetime_epoch + timedelta(seconds=filetime_seconds)
+    @contextlib.contextmanager
+    def phase(self, name: str, game: str | None = None, user: str | None = None):
+        counters: Dict[str, int] = {}
+        previous = getattr(metrics_local, "counters", None)
+        metrics_local.counters = counters
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            metrics_local.counters = previous
+            self.add_phase(name, game, user, time.perf_counter() - start, counters)
+
+    def add_phase(
+        self,
+        name: str,
+        game: str | None,
+        user: str | None,
+        wall_time: float,
+        counters: Dict[str, int],
+    ):
+        with self.lock:
+            self.phases.append(
+                {
+                    "phase": name,
+                    "game": game,
+                    "user": user,
+                    "wall_time": wall_time,
+                    **counters,
+                }
+            )
+
+    def report(self) -> Dict[str, Any]:
+        totals: Dict[str, Dict[str, float]] = {}
+        with self.lock:
+            phases = list(self.phases)
+        for phase in phases:
+            total = totals.setdefault(phase["phase"], {"count": 0})
+            total["count"] += 1
+            for key, value in phase.items():
+                if key in ("phase", "game", "user"):
+                    continue
+                total[key] = total.get(key, 0) + value
+        return {
+            "version": 1,
+            "wall_time": time.perf_counter() - self.started,
+            "totals": totals,
+            "phases": phases,
+        }
+
+
+# Counters of the phase that is measured in the current thread
+metrics_local = threading.local()
+# Set with --profile or --metrics-json
+metrics: Metrics | None = None
+
+
+def measure(name: str, game: str | None = None, user: str | None = None):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.phase(name, game, user)
+
+
+def measure_iter(
+    name: str,
+    game: str | None,
+    user: str | None,
+    iterable,
+    item_counter: str = "files",
+):
+    # Like measure(), but only counts the time and I/O spent producing the items of a lazy
+    # iterable. Time spent in nested measure_iter() iterables is left out.
+    if metrics is None:
+        yield from iterable
+        return
+    wall_time = 0.0
+    counters: Dict[str, int] = {}
+    items = 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            previous_counters = getattr(metrics_local, "counters", None)
+            outer_nested_time = getattr(metrics_local, "nested_time", 0.0)
+            metrics_local.counters = counters
+            metrics_local.nested_time = 0.0
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed = time.perf_counter() - start
+                wall_time += elapsed - metrics_local.nested_time
+                metrics_local.counters = previous_counters
+                metrics_local.nested_time = outer_nested_time + elapsed
+            items += 1
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+        counters[item_counter] = items
+        metrics.add_phase(name, game, user, wall_time, counters)
+
+
+def count(counter: str, amount: int = 1):
+    counters = getattr(metrics_local, "counters", None)
+    if counters is not None:
+        counters[counter] = counters.get(counter, 0) + amount
 
 
 def print_sync_warning(title: str):
-    print()
-    print(f"  !! {title} !!")
-    print("     Xbox cloud save syncing might not be complete, try again later.")
-    print("     Extracted saves for this game might be corrupted!")
-    print("     Press enter to skip and continue.")
-    input()
+    log()
+    log(f"  !! {title} !!")
+    log("     Xbox cloud save syncing might not be complete, try again later.")
+    log("     Extracted saves for this game might be corrupted!")
+    log("     Press enter to skip and continue.")
+    pause()
 
 
-def get_xbox_user_name(user_id: int) -> str | None:
+@functools.lru_cache(maxsize=None)
+def get_xbox_user_name(user_id: int, packages_root: Path) -> str | None:
     xbox_app_package = "Microsoft.XboxApp_8wekyb3d8bbwe"
     try:
         live_gamer_path = (
@@ -93,30 +1573,62 @@ def get_xbox_user_name(user_id: int) -> str | None:
         return None
 
 
-def find_user_containers(pkg_name: str) -> List[Tuple[int | str, Path]]:
+# What to do with the backup directories that the Xbox app creates in the wgs directory
+BACKUP_POLICIES = ["skip", "newest"]
+
+
+def find_user_backups(
+    user_dir: Path, backup_dirs: List[Path], only_user: bool
+) -> List[Path]:
+    # Backup snapshots of one user directory: a subdirectory named like the user directory,
+    # or the backup directory itself when it has the user ID in its name (or there is one user)
+    user_id_hex = user_dir.name.split("_", 1)[0].lower()
+    snapshots = []
+    for backup_dir in backup_dirs:
+        nested_dir = backup_dir / user_dir.name
+        count("stat_calls")
+        if (nested_dir / "containers.index").is_file():
+            snapshots.append(nested_dir)
+            continue
+        if not only_user and user_id_hex not in backup_dir.name.lower():
+            continue
+        count("stat_calls")
+        if (backup_dir / "containers.index").is_file():
+            snapshots.append(backup_dir)
+    return snapshots
+
+
+def find_user_containers(
+    pkg_name: str, packages_root: Path, backups: str = "skip"
+) -> List[Tuple[int | str, Path, List[Path]]]:
     # Find container dir
     wgs_dir = packages_root / pkg_name / "SystemAppData/wgs"
-    if not wgs_dir.is_dir():
-        return []
     # Get the correct user directory
-    has_backups = False
+    backup_dirs = []
     valid_user_dirs = []
-    for entry in wgs_dir.iterdir():
-        if not entry.is_dir():
-            continue
-        if entry.name == "t":
-            continue
-        if "backup" in entry.name:
-            has_backups = True
-            continue
-        if len(entry.name.split("_")) == 2:
-            valid_user_dirs.append(entry)
+    try:
+        count("scandir_calls")
+        with os.scandir(wgs_dir) as it:
+            # DirEntry.is_dir() uses the file type returned by the directory listing
+            for entry in it:
+                if entry.name == "t":
+                    continue
+                if not entry.is_dir():
+                    continue
+                if "backup" in entry.name:
+                    backup_dirs.append(Path(entry.path))
+                    continue
+                if len(entry.name.split("_")) == 2:
+                    valid_user_dirs.append(Path(entry.path))
+    except (FileNotFoundError, NotADirectoryError):
+        return []
 
-    if has_backups:
-        print("  !! The save directory contains backups !!")
-        print("     This script will currently skip backups made by the Xbox app.")
-        print("     Press enter to continue.")
-        input()
+    if len(backup_dirs) > 0 and backups == "skip":
+        log("  !! The save directory contains backups !!")
+        log("     This script skips backups made by the Xbox app by default,")
+        log("     use --backups newest to extract the newest copy of each save.")
+        log("     Press enter to continue.")
+        pause()
 
     if len(valid_user_dirs) == 0:
         # No saves for any users
@@ -127,212 +1639,539 @@ def find_user_containers(pkg_name: str) -> List[Tuple[int | str, Path]]:
     for valid_user_dir in valid_user_dirs:
         user_id_hex, title_id_hex = valid_user_dir.name.split("_", 1)
         user_id = int(user_id_hex, 16)
-        user_name = get_xbox_user_name(user_id)
-        user_dirs.append((user_name or user_id, valid_user_dir))
+        user_name = get_xbox_user_name(user_id, packages_root)
+        user_backups = []
+        if backups != "skip":
+            user_backups = find_user_backups(
+                valid_user_dir, backup_dirs, len(valid_user_dirs) == 1
+            )
+        user_dirs.append((user_name or user_id, valid_user_dir, user_backups))
 
     return user_dirs
 
 
-def read_user_containers(user_wgs_dir: Path) -> Tuple[str, List[Dict[str, Any]]]:
-    containers_dir = user_wgs_dir
-    containers_idx_path = containers_dir / "containers.index"
+# How to choose between two existing files when the GUIDs of a container file entry differ
+CONFLICT_POLICIES = ["skip", "fail", "newest", "largest", "keep-both"]
+# Name suffix of the container copy that holds the other files with --on-conflict keep-both,
+# and of the save files converted from them
+CONFLICT_COPY_SUFFIX = ".conflict"
 
-    containers = []
 
-    # Read the index file
-    with containers_idx_path.open("rb") as f:
-        # Unknown
-        f.read(4)
+def list_container_dir(container_path: Path) -> Dict[str, os.DirEntry]:
+    # Files of a container directory by their upper case name, from one directory listing
+    count("scandir_calls")
+    try:
+        with os.scandir(container_path) as it:
+            return {entry.name.upper(): entry for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+class ContainerIndex:
+    # A containers.index file of a user directory. The header is decoded when the index is
+    # opened, the containers are decoded and their container files read one at a time
+    # by iter_containers().
 
-        container_count = struct.unpack("<i", f.read(4))[0]
+    def __init__(self, user_wgs_dir: Path):
+        self.path = user_wgs_dir
+        # Read the whole index file at once and decode it from the buffer
+        self.buf = (user_wgs_dir / "containers.index").read_bytes()
+        count("files_read")
+        count("bytes_read", len(self.buf))
+        buf = self.buf
+
+        self.container_count: int = INDEX_HEADER.unpack_from(buf, 0)[0]
+        offset = INDEX_HEADER.size
 
         # Package display name seems to be available only on console saves
-        pkg_display_name = read_utf16_str(f)
+        self.display_name, offset = unpack_utf16_str(buf, offset)
 
-        store_pkg_name = read_utf16_str(f).split("!")[0]
+        store_pkg_name, offset = unpack_utf16_str(buf, offset)
+        self.store_pkg_name = store_pkg_name.split("!")[0]
 
         # Creation date, FILETIME
-        creation_date = read_filetime(f)
-        # print(f"  Container index created at {creation_date}")
+        self.filetime: int = INDEX_CREATION.unpack_from(buf, offset)[0]
+        offset += INDEX_CREATION.size
         # Unknown
-        f.read(4)
-        read_utf16_str(f)
+        _, offset = unpack_utf16_str(buf, offset)
+        offset += INDEX_PADDING.size
+        self.entries_offset = offset
 
-        # Unknown
-        f.read(8)
-
-        for _ in range(container_count):
-            # Container name
-            container_name = read_utf16_str(f)
-            # Duplicate of the file name
-            read_utf16_str(f)
-            # Unknown quoted hex number
-            read_utf16_str(f)
-            # Container number
-            container_num = struct.unpack("B", f.read(1))[0]
-            # Unknown
-            f.read(4)
-            # Read container (folder) GUID
-            container_guid = uuid.UUID(bytes_le=f.read(16))
-            # Creation date, FILETIME
-            container_creation_date = read_filetime(f)
-            # print(f"Container created at {container_creation_date}")
-            # Unknown
-            f.read(16)
-
-            files = []
-
-            # Read the container file in the container directory
-            container_path = containers_dir / container_guid.hex.upper()
-            container_file_path = container_path / f"container.{container_num}"
-
-            if not container_file_path.is_file():
-                print_sync_warning(f'Missing container "{container_name}"')
-                continue
+    @property
+    def creation_date(self) -> datetime:
+        return filetime_to_datetime(self.filetime)
+
+    def iter_containers(self, on_conflict: str = "skip") -> Iterator[Container]:
+        buf = self.buf
+        offset = self.entries_offset
+        conflict_decisions: List[str] = []
+
+        try:
+            for _ in range(self.container_count):
+                # Container name
+                container_name, offset = unpack_utf16_str(buf, offset)
+                # Duplicate of the file name
+                _, offset = unpack_utf16_str(buf, offset)
+                # Unknown quoted hex number
+                _, offset = unpack_utf16_str(buf, offset)
+                container_num, container_guid_bytes, container_filetime = (
+                    INDEX_ENTRY.unpack_from(buf, offset)
+                )
+                offset += INDEX_ENTRY.size
+                container_guid = uuid.UUID(bytes_le=container_guid_bytes)
+
+                files = []
+                # Files used instead of the conflicting ones in the copy of the container (keep-both)
+                alternates: Dict[int, ContainerFile] = {}
+                listing = None
+
+                # Read the container file in the container directory
+                container_path = self.path / container_guid.hex.upper()
+                container_file_path = container_path / f"container.{container_num}"
+
+                try:
+                    cbuf = container_file_path.read_bytes()
+                    count("files_read")
+                    count("bytes_read", len(cbuf))
+                except OSError:
+                    print_sync_warning(f'Missing container "{container_name}"')
+                    continue
 
-            with container_file_path.open("rb") as cf:
-                # Unknown (always 04 00 00 00 ?)
-                cf.read(4)
                 # Number of files in this container
-                file_count = struct.unpack("<i", cf.read(4))[0]
-                for _ in range(file_count):
-                    # File name, 0x80 (128) bytes UTF-16 = 64 characters
-                    file_name = read_utf16_str(cf, 64)
+                file_count = CONTAINER_HEADER.unpack_from(cbuf, 0)[0]
+                entries_end = CONTAINER_HEADER.size + file_count * CONTAINER_ENTRY.size
+                if entries_end > len(cbuf):
+                    raise struct.error(f'Truncated container file "{container_file_path}"')
+                entries = memoryview(cbuf)[CONTAINER_HEADER.size : entries_end]
+                for name_bytes, guid_bytes, guid_2_bytes in CONTAINER_ENTRY.iter_unpack(
+                    entries
+                ):
+                    file_name = name_bytes.decode("utf-16").rstrip("\0")
                     # Read file GUID
-                    file_guid = uuid.UUID(bytes_le=cf.read(16))
-                    # Read the copy of the GUID
-                    file_guid_2 = uuid.UUID(bytes_le=cf.read(16))
+                    file_guid = uuid.UUID(bytes_le=guid_bytes)
+                    # Read the copy of the GUID, usually identical to the first one
+                    if guid_2_bytes == guid_bytes:
+                        file_guid_2 = file_guid
+                    else:
+                        file_guid_2 = uuid.UUID(bytes_le=guid_2_bytes)
 
                     if file_guid == file_guid_2:
                         file_path = container_path / file_guid.hex.upper()
                     else:
-                        # Check if one of the file paths exist
-                        file_guid_1_path = container_path / file_guid.hex.upper()
-                        file_guid_2_path = container_path / file_guid_2.hex.upper()
-
-                        file_1_exists = file_guid_1_path.is_file()
-                        file_2_exists = file_guid_2_path.is_file()
-
-                        if file_1_exists and not file_2_exists:
-                            file_path = file_guid_1_path
-                        elif not file_1_exists and file_2_exists:
-                            file_path = file_guid_2_path
-                        elif file_1_exists and file_2_exists:
+                        # List the container directory once and check both files against the listing
+                        if listing is None:
+                            listing = list_container_dir(container_path)
+                        file_1_entry = listing.get(file_guid.hex.upper())
+                        file_2_entry = listing.get(file_guid_2.hex.upper())
+
+                        if file_1_entry is not None and file_2_entry is None:
+                            file_path = Path(file_1_entry.path)
+                        elif file_1_entry is None and file_2_entry is not None:
+                            file_path = Path(file_2_entry.path)
+                            file_guid, file_guid_2 = (file_guid_2, file_guid)
+                        elif file_1_entry is not None and file_2_entry is not None:
                             # Which one to use?
-                            print_sync_warning(
-                                f'Two files exist for container "{container_name}" file "{file_name}": {file_guid} and {file_guid_2}, can\'t choose one'
-                            )
-                            continue
+                            conflict = f'"{container_name}" file "{file_name}" ({file_guid} and {file_guid_2})'
+                            count("conflicts")
+                            if on_conflict == "fail":
+                                raise Exception(f"Two files exist for container {conflict}")
+                            if on_conflict == "skip":
+                                conflict_decisions.append(
+                                    f"{conflict}: skipped, can't choose one"
+                                )
+                                continue
+                            count("stat_calls", 2)
+                            stat_1 = file_1_entry.stat()
+                            stat_2 = file_2_entry.stat()
+                            if on_conflict == "largest":
+                                use_second = stat_2.st_size > stat_1.st_size
+                            else:
+                                use_second = stat_2.st_mtime_ns > stat_1.st_mtime_ns
+                            chosen_entry, other_entry = (file_1_entry, file_2_entry)
+                            if use_second:
+                                chosen_entry, other_entry = (file_2_entry, file_1_entry)
+                                file_guid, file_guid_2 = (file_guid_2, file_guid)
+                            file_path = Path(chosen_entry.path)
+                            if on_conflict == "keep-both":
+                                alternates[len(files)] = ContainerFile(
+                                    file_name, file_guid_2, Path(other_entry.path), file_guid
+                                )
+                                conflict_decisions.append(
+                                    f"{conflict}: using the newest one ({file_path.name}), "
+                                    f'the other one is kept as a "{CONFLICT_COPY_SUFFIX}" copy'
+                                )
+                            else:
+                                conflict_decisions.append(
+                                    f"{conflict}: using the {on_conflict} one ({file_path.name})"
+                                )
                         else:
                             print_sync_warning(
                                 f'Missing file "{file_name}" inside container "{container_name}"'
                             )
                             continue
 
-                    files.append(
-                        {
-                            "name": file_name,
-                            # "guid": file_guid,
-                            "path": file_path,
-                        }
+                    files.append(ContainerFile(file_name, file_guid, file_path, file_guid_2))
+
+                yield Container(
+                    container_name, container_num, container_guid, container_filetime, files
+                )
+                if len(alternates) > 0:
+                    # Keep the other versions of the conflicting files in a copy of the container
+                    yield Container(
+                        f"{container_name}{CONFLICT_COPY_SUFFIX}",
+                        container_num,
+                        container_guid,
+                        container_filetime,
+                        [alternates.get(i, file) for i, file in enumerate(files)],
                     )
+        finally:
+            # Also report the conflicts when the handler stops early and closes the iterator
+            if len(conflict_decisions) > 0:
+                # Report the conflicts once instead of stopping at each of them
+                log(f"  {len(conflict_decisions)} file(s) exist with two different GUIDs:")
+                for decision in conflict_decisions:
+                    log(f"  - {decision}")
+                if on_conflict == "skip":
+                    log("    Xbox cloud save syncing might not be complete, try again later.")
+                    log("    Choose a file automatically with --on-conflict.")
+
+
+def iter_containers(
+    user_wgs_dir: Path, on_conflict: str = "skip"
+) -> Iterator[Container]:
+    # Decode the containers of a user directory lazily, one container at a time
+    return ContainerIndex(user_wgs_dir).iter_containers(on_conflict)
+
+
+def first_container(containers: Iterable[Container]) -> Container:
+    # Handlers of single-container layouts only use the first container, the rest of a lazy
+    # iterator is closed right away so that the parser reports its decisions before the export
+    iterator = iter(containers)
+    try:
+        return next(iterator)
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
 
-            containers.append(
-                {
-                    "name": container_name,
-                    "number": container_num,
-                    # "guid": container_guid,
-                    "files": files,
-                }
+
+def read_user_containers(
+    user_wgs_dir: Path, on_conflict: str = "skip"
+) -> Tuple[str, List[Container]]:
+    index = ContainerIndex(user_wgs_dir)
+    return (index.store_pkg_name, list(index.iter_containers(on_conflict)))
+
+
+def same_container_files(container: Container, other: Container) -> bool:
+    # Compare the sizes and mtimes of the files first and only hash the files when needed
+    if [f.name for f in container.files] != [f.name for f in other.files]:
+        return False
+    for file, other_file in zip(container.files, other.files):
+        if file.path == other_file.path:
+            continue
+        st = file.path.stat()
+        other_st = other_file.path.stat()
+        count("stat_calls", 2)
+        if st.st_size != other_st.st_size:
+            return False
+        if st.st_mtime_ns == other_st.st_mtime_ns:
+            continue
+        digests = []
+        for path in (file.path, other_file.path):
+            hasher = hashlib.sha256()
+            for chunk in iter_source_chunks(path):
+                hasher.update(chunk)
+            digests.append(hasher.digest())
+        if digests[0] != digests[1]:
+            return False
+    return True
+
+
+def read_user_snapshots(
+    user_wgs_dir: Path, backup_dirs: List[Path], on_conflict: str = "skip"
+) -> Tuple[str, List[Container]]:
+    # Read a user directory and its backups made by the Xbox app, and use the newest snapshot
+    # of every container by the container creation date. Backups that can't be read are skipped.
+    store_pkg_name, containers = read_user_containers(user_wgs_dir, on_conflict)
+    if len(backup_dirs) == 0:
+        return (store_pkg_name, containers)
+
+    chosen = group_conflict_copies(containers)
+    for backup_dir in backup_dirs:
+        try:
+            _, backup_containers = read_user_containers(backup_dir, on_conflict)
+        except (OSError, struct.error, ValueError) as e:
+            log(f'  Skipping unreadable backup "{backup_dir}": {e}')
+            continue
+        for name, group in group_conflict_copies(backup_containers).items():
+            container = group[0]
+            if len(container.files) == 0:
+                continue
+            current = chosen.get(name)
+            if current is not None:
+                if container.filetime <= current[0].filetime:
+                    continue
+                # Keep the current copy when the newer snapshot has the same data
+                if same_container_files(current[0], container):
+                    continue
+            chosen[name] = group
+
+    live_containers = {id(container) for container in containers}
+    from_backups = sum(1 for g in chosen.values() if id(g[0]) not in live_containers)
+    if from_backups > 0:
+        log(f"  Using the backup copy of {from_backups} container(s)")
+    return (store_pkg_name, [c for group in chosen.values() for c in group])
+
+
+def group_conflict_copies(containers: List[Container]) -> Dict[str, List[Container]]:
+    # Containers by name, each followed by its --on-conflict keep-both copy if it has one
+    groups: Dict[str, List[Container]] = {}
+    for container in containers:
+        group = groups.get(container.name.removesuffix(CONFLICT_COPY_SUFFIX))
+        if (
+            group is not None
+            and container.name == f"{group[0].name}{CONFLICT_COPY_SUFFIX}"
+            and container.guid == group[0].guid
+        ):
+            group.append(container)
+        else:
+            groups[container.name] = [container]
+    return groups
+
+
+class ContainerIndexWriter:
+    # Writes containers into a new user directory: the files of each container into a
+    # GUID-named directory with its container.N file, and the containers.index that lists
+    # them. The files are written concurrently, the index is written last.
+
+    def __init__(self, user_wgs_dir: Path, store_pkg_name: str, threads: int = 4):
+        self.path = user_wgs_dir
+        self.store_pkg_name = store_pkg_name
+        self.filetime = datetime_to_filetime(datetime.now(timezone.utc))
+        self.entries: List[Tuple[str, int, uuid.UUID]] = []
+        self.files = DirectoryArchiveWriter(user_wgs_dir, threads)
+
+    def add(self, name: str, files: List[Tuple[str, SaveSource]], number: int = 1):
+        guid = uuid.uuid4()
+        container_dir = guid.hex.upper()
+        cbuf = bytearray(struct.pack("<ii", CONTAINER_VERSION, len(files)))
+        for file_name, source in files:
+            name_bytes = file_name.encode("utf-16-le")
+            if len(name_bytes) > 128:
+                raise ValueError(
+                    f'File name "{file_name}" is longer than 64 characters'
+                )
+            file_guid = uuid.uuid4()
+            cbuf += CONTAINER_ENTRY.pack(
+                name_bytes, file_guid.bytes_le, file_guid.bytes_le
             )
+            self.files.add(f"{container_dir}/{file_guid.hex.upper()}", source)
+        self.files.add(f"{container_dir}/container.{number}", bytes(cbuf))
+        self.entries.append((name, number, guid))
+
+    def close(self):
+        self.files.close()
+        buf = bytearray(struct.pack("<ii", INDEX_VERSION, len(self.entries)))
+        buf += pack_utf16_str("")
+        buf += pack_utf16_str(f"{self.store_pkg_name}!App")
+        buf += INDEX_CREATION.pack(self.filetime)
+        buf += pack_utf16_str("1")
+        buf += INDEX_PADDING.pack()
+        for name, number, guid in self.entries:
+            buf += pack_utf16_str(name)
+            buf += pack_utf16_str(name)
+            buf += pack_utf16_str(f'"0x{self.filetime:016X}"')
+            buf += INDEX_ENTRY.pack(number, guid.bytes_le, self.filetime)
+        (self.path / "containers.index").write_bytes(buf)
+        count("bytes_written", len(buf))
+
+
+class SaveHandler:
+    # Converts the containers of a game into the files used by the Steam/Epic version.
+    # Handlers are registered by the "handler" name used in games.json and built once per game
+    # with the game's "handler_args".
+
+    name = ""
+    # Accepted handler_args and their types
+    args: Dict[str, type] = {}
+
+    def __init__(self, handler_args: Dict[str, Any]):
+        for key, value in handler_args.items():
+            if key not in self.args:
+                raise ValueError(f'handler "{self.name}" has no argument "{key}"')
+            if not isinstance(value, self.args[key]):
+                raise ValueError(
+                    f'handler "{self.name}" argument "{key}" must be of type {self.args[key].__name__}'
+                )
+        self.handler_args = handler_args
 
-    return (store_pkg_name, containers)
+    def iter_saves(
+        self, containers: Iterable[Container]
+    ) -> Iterator[Tuple[str, SaveSource]]:
+        # Yield (file name, source) pairs one at a time. The containers can be a lazy iterator.
+        raise NotImplementedError
 
+    def import_saves(
+        self, saves: Iterable[Tuple[str, Path]]
+    ) -> Iterator[Tuple[str, List[Tuple[str, SaveSource]]]]:
+        # The reverse of iter_saves(): yield (container name, [(file name, source)]) pairs for
+        # the Steam/Epic save files, given as ("/" separated file name, path) pairs
+        raise NotImplementedError(f'Handler "{self.name}" can\'t import saves')
 
-def get_save_paths(
-    supported_games: Dict[str, Any],
-    store_pkg_name: str,
-    containers: List[Dict[str, Any]],
-    temp_dir: tempfile.TemporaryDirectory,
-) -> List[Tuple[str, Path]]:
-    save_meta = []
 
-    handler_name = supported_games[store_pkg_name]["handler"]
-    handler_args = supported_games[store_pkg_name].get("handler_args") or {}
+# Names of the containers and container files that the Steam/Epic saves don't have a name for
+IMPORT_CONTAINER_NAME = "savedata"
+IMPORT_FILE_NAME = "data"
+
+
+HANDLERS: Dict[str, type[SaveHandler]] = {}
+# Third-party handlers can be registered with this entry point group
+HANDLER_ENTRY_POINT_GROUP = "xgp_save_extractor.handlers"
+handler_plugins_loaded = False
+
 
-    if handler_name == "1c1f":
-        # "1 container, 1 file" (1c1f). Each container contains only one file which name will be the name of the container.
-        file_suffix = handler_args.get("suffix")
+def register_handler(name: str):
+    def decorator(cls: type[SaveHandler]) -> type[SaveHandler]:
+        cls.name = name
+        HANDLERS[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_handler_class(name: str) -> type[SaveHandler] | None:
+    global handler_plugins_loaded
+    if name not in HANDLERS and not handler_plugins_loaded:
+        # Only look for plugins when games.json refers to a handler that isn't built in
+        handler_plugins_loaded = True
+        for entry_point in importlib.metadata.entry_points(
+            group=HANDLER_ENTRY_POINT_GROUP
+        ):
+            register_handler(entry_point.name)(entry_point.load())
+    return HANDLERS.get(name)
+
+
+@register_handler("1c1f")
+class OneContainerOneFileHandler(SaveHandler):
+    # "1 container, 1 file" (1c1f). Each container contains only one file which name will be the name of the container.
+    args = {"suffix": str}
+
+    def iter_saves(self, containers):
+        file_suffix = self.handler_args.get("suffix")
         for container in containers:
-            fname = container["name"]
+            fname = container.name
             if file_suffix is not None:
                 # Add a suffix to the file name if configured
                 fname += file_suffix
-            fpath = container["files"][0]["path"]
-            save_meta.append((fname, fpath))
-
-    elif handler_name == "1cnf":
-        # "1 container, n files" (1cnf). There's only one container that contains all the savefiles.
-        file_suffix = handler_args.get("suffix")
-        container = containers[0]
-        for c_file in container["files"]:
-            final_filename = c_file["name"]
+            fpath = container.files[0].path
+            yield (fname, fpath)
+
+    def import_saves(self, saves):
+        file_suffix = self.handler_args.get("suffix")
+        for fname, fpath in saves:
+            if file_suffix is not None:
+                fname = fname.removesuffix(file_suffix)
+            yield (fname, [(IMPORT_FILE_NAME, fpath)])
+
+
+@register_handler("1cnf")
+class OneContainerManyFilesHandler(SaveHandler):
+    # "1 container, n files" (1cnf). There's only one container that contains all the savefiles.
+    args = {"suffix": str}
+
+    def iter_saves(self, containers):
+        file_suffix = self.handler_args.get("suffix")
+        container = first_container(containers)
+        for c_file in container.files:
+            final_filename = c_file.name
             if file_suffix is not None:
                 # Add a suffix to the file name if configured
                 final_filename += file_suffix
-            save_meta.append((final_filename, c_file["path"]))
+            yield (final_filename, c_file.path)
 
-    elif handler_name == "1cnf-folder":
-        # Each container represents one folder
+    def import_saves(self, saves):
+        file_suffix = self.handler_args.get("suffix")
+        files = []
+        for fname, fpath in saves:
+            if file_suffix is not None:
+                fname = fname.removesuffix(file_suffix)
+            files.append((fname, fpath))
+        yield (IMPORT_CONTAINER_NAME, files)
+
+
+@register_handler("1cnf-folder")
+class ContainerFolderHandler(SaveHandler):
+    # Each container represents one folder
+
+    def iter_saves(self, containers):
         for container in containers:
-            folder_name: str = container["name"]
-            for file in container["files"]:
-                fname = file["name"]
+            folder_name: str = container.name
+            for file in container.files:
+                fname = file.name
                 zip_fname = f"{folder_name}/{fname}"
-                fpath = file["path"]
-                save_meta.append((zip_fname, fpath))
-
-    elif handler_name == "control":
-        # Handle Control saves
-        # Control uses container in a "n containers, n files" manner (ncnf),
-        # where the container represents a folder that has named files.
-        # Epic Games Store (and Steam?) use the same file names, but with a ".chunk" file extension.
-        # TODO: Are files named "meta" unnecessary?
+                fpath = file.path
+                yield (zip_fname, fpath)
+
+    def import_saves(self, saves):
+        folders: Dict[str, List[Tuple[str, SaveSource]]] = {}
+        for zip_fname, fpath in saves:
+            folder_name, sep, fname = zip_fname.rpartition("/")
+            if not sep:
+                raise ValueError(f'"{zip_fname}" is not in a folder')
+            folders.setdefault(folder_name, []).append((fname, fpath))
+        yield from folders.items()
+
+
+@register_handler("control")
+class ControlHandler(SaveHandler):
+    # Handle Control saves
+    # Control uses container in a "n containers, n files" manner (ncnf),
+    # where the container represents a folder that has named files.
+    # Epic Games Store (and Steam?) use the same file names, but with a ".chunk" file extension.
+    # TODO: Are files named "meta" unnecessary?
+
+    def iter_saves(self, containers):
         for container in containers:
-            path = PurePath(container["name"])
+            path = PurePath(container.name)
 
             # Create "--containerDisplayName.chunk" that contains the container name
             # TODO: Does Control _need_ "--containerDisplayName.chunk"?
-            temp_container_disp_name_path = (
-                Path(temp_dir.name)
-                / f"{container['name']}_--containerDisplayName.chunk"
-            )
-            with temp_container_disp_name_path.open("w") as f:
-                f.write(container["name"])
-            save_meta.append(
-                (path / "--containerDisplayName.chunk", temp_container_disp_name_path)
+            yield (
+                str(path / "--containerDisplayName.chunk"),
+                container.name.encode("utf-8"),
             )
 
-            for file in container["files"]:
-                save_meta.append((path / f"{file['name']}.chunk", file["path"]))
+            for file in container.files:
+                yield (str(path / f"{file.name}.chunk"), file.path)
+
+    def import_saves(self, saves):
+        folders: Dict[str, List[Tuple[str, SaveSource]]] = {}
+        for fname, fpath in saves:
+            path = PurePath(fname)
+            files = folders.setdefault(path.parent.as_posix(), [])
+            # The container name is the folder name
+            if path.name == "--containerDisplayName.chunk":
+                continue
+            files.append((path.name.removesuffix(".chunk"), fpath))
+        yield from folders.items()
 
-    elif handler_name == "starfield":
-        # Starfield
-        # The Steam version uses SFS ("Starfield save"?) files, whereas the Store version splits the SFS files into multiple files inside the containers.
-        # One container is one save.
-        # It seems that the "BETHESDAPFH" file is a header which is padded to the next 16 byte boundary with the string "padding\0", where \0 is NUL.
-        # The other files ("PnP", where n is a number starting from 0) are then concatenated into the SFS file, also with padding.
 
-        # As of at least Starfield version 1.9.51.0, the containers contain "toc" and one or more "BlobDataN" files (where N is a number starting from 0).
-        # The new format seems to already include the padding.
+@register_handler("starfield")
+class StarfieldHandler(SaveHandler):
+    # Starfield
+    # The Steam version uses SFS ("Starfield save"?) files, whereas the Store version splits the SFS files into multiple files inside the containers.
+    # One container is one save.
+    # It seems that the "BETHESDAPFH" file is a header which is padded to the next 16 byte boundary with the string "padding\0", where \0 is NUL.
+    # The other files ("PnP", where n is a number starting from 0) are then concatenated into the SFS file, also with padding.
 
-        temp_folder = Path(temp_dir.name) / "Starfield"
-        temp_folder.mkdir()
+    # As of at least Starfield version 1.9.51.0, the containers contain "toc" and one or more "BlobDataN" files (where N is a number starting from 0).
+    # The new format seems to already include the padding.
 
-        pad_str = "padding\0" * 2
+    # Size of the BlobDataN files written when importing, a multiple of 16
+    blob_size = 16 * 1024 * 1024
 
+    def iter_saves(self, containers):
         for container in containers:
-            path = PurePath(container["name"])
+            path = PurePath(container.name)
             # There can be other files than saves, e.g. files under "Settings/" path. Skip those.
             if path.parent.name != "Saves":
                 continue
@@ -341,37 +2180,47 @@ def get_save_paths(
             # Arrange the files: header as index 0, P0P as 1, P1P as 2, etc. (or BlobData0, ... for the new format)
             parts = {}
 
-            is_new_format = "toc" in [f["name"] for f in container["files"]]
+            is_new_format = "toc" in [f.name for f in container.files]
 
-            for file in container["files"]:
-                if file["name"] == "toc":
+            for file in container.files:
+                if file.name == "toc":
                     continue
                 if is_new_format:
-                    idx = int(file["name"].removeprefix("BlobData"))
+                    idx = int(file.name.removeprefix("BlobData"))
                 else:
-                    if file["name"] == "BETHESDAPFH":
+                    if file.name == "BETHESDAPFH":
                         idx = 0
                     else:
-                        idx = int(file["name"].strip("P")) + 1
-                parts[idx] = file["path"]
+                        idx = int(file.name.strip("P")) + 1
+                parts[idx] = file.path
 
-            # Construct the SFS file
-            sfs_path = temp_folder / sfs_name
-            with sfs_path.open("wb") as sfs_f:
-                for idx, part_path in sorted(parts.items(), key=lambda t: t[0]):
-                    with open(part_path, "rb") as part_f:
-                        data = part_f.read()
-                    size = sfs_f.write(data)
-                    pad = 16 - (size % 16)
-                    if pad != 16:
-                        sfs_f.write(pad_str[:pad].encode("ascii"))
+            # The SFS file is constructed while it is written into the archive
+            parts_in_order = [part_path for _, part_path in sorted(parts.items())]
+            yield (sfs_name, PaddedParts(parts_in_order))
 
-            save_meta.append((sfs_name, sfs_path))
-
-    elif handler_name == "lies-of-p":
-        # Lies of P
+    def import_saves(self, saves):
+        for sfs_name, fpath in saves:
+            if not sfs_name.endswith(".sfs"):
+                continue
+            # The SFS file is split into BlobDataN files in the new format. The padding is
+            # already in the SFS file, and the parts are multiples of 16 bytes so no padding is
+            # added when they are joined again. The contents of "toc" are not known, an empty
+            # file marks the new format.
+            size = fpath.stat().st_size
+            files: List[Tuple[str, SaveSource]] = [("toc", b"")]
+            for i, offset in enumerate(range(0, size, self.blob_size)):
+                part = FileSlice(fpath, offset, min(self.blob_size, size - offset))
+                files.append((f"BlobData{i}", part))
+            yield (f"Saves/{sfs_name}", files)
+
+
+@register_handler("lies-of-p")
+class LiesOfPHandler(SaveHandler):
+    # Lies of P
+
+    def iter_saves(self, containers):
         for container in containers:
-            fname: str = container["name"]
+            fname: str = container.name
             # Lies of P prefixes the save file names with a numeric ID
             # Filter the numbers out
             for i, c in enumerate(fname):
@@ -382,22 +2231,41 @@ def get_save_paths(
 
             # The names also need a ".sav" suffix
             fname += ".sav"
-            fpath = container["files"][0]["path"]
+            fpath = container.files[0].path
 
-            save_meta.append((fname, fpath))
+            yield (fname, fpath)
 
-    elif handler_name == "palworld":
+    def import_saves(self, saves):
+        for i, (fname, fpath) in enumerate(saves):
+            # The numeric IDs are not in the file names, number the containers instead
+            yield (f"{i}{fname.removesuffix('.sav')}", [(IMPORT_FILE_NAME, fpath)])
+
+
+@register_handler("palworld")
+class PalworldHandler(SaveHandler):
+    def iter_saves(self, containers):
         for container in containers:
-            fname = container["name"]
+            fname = container.name
             # Each "-" in the name is a directory separator
             fname = fname.replace("-", "/")
             fname += ".sav"
-            fpath = container["files"][0]["path"]
-            save_meta.append((fname, fpath))
+            fpath = container.files[0].path
+            yield (fname, fpath)
+
+    def import_saves(self, saves):
+        for fname, fpath in saves:
+            container_name = fname.removesuffix(".sav").replace("/", "-")
+            yield (container_name, [(IMPORT_FILE_NAME, fpath)])
+
+
+@register_handler("like-a-dragon")
+class LikeADragonHandler(SaveHandler):
+    args = {"icon_format": str}
 
-    elif handler_name == "like-a-dragon":
+    def iter_saves(self, containers):
+        icon_format = self.handler_args.get("icon_format")
         for container in containers:
-            path = PurePath(container["name"])
+            path = PurePath(container.name)
             if path.name == "datasav":
                 fpath = path.with_name("data.sav")
             elif path.name == "datasys":
@@ -405,167 +2273,1359 @@ def get_save_paths(
             else:
                 fpath = path
 
-            for file in container["files"]:
-                if file["name"].lower() == "data":
-                    save_meta.append((str(fpath), file["path"]))
-                elif file["name"].lower() == "icon":
-                    icon_format = handler_args.get("icon_format")
+            for file in container.files:
+                if file.name.lower() == "data":
+                    yield (str(fpath), file.path)
+                elif file.name.lower() == "icon":
                     if icon_format is None:
                         continue
-                    save_meta.append(
-                        (
-                            str(
-                                fpath.with_name(
-                                    f"{fpath.parent.name}_icon.{icon_format}"
-                                )
-                            ),
-                            file["path"],
-                        )
+                    yield (
+                        str(fpath.with_name(f"{fpath.parent.name}_icon.{icon_format}")),
+                        file.path,
                     )
 
-    elif handler_name == "cricket-24":
-        # 1cnf-folder, but with a file suffix and "CHUNK" suffix removal
-        # TODO: Can there be more than one chunk?
+    def import_saves(self, saves):
+        icon_format = self.handler_args.get("icon_format")
+        containers: Dict[str, List[Tuple[str, SaveSource]]] = {}
+        for fname, fpath in saves:
+            path = PurePath(fname)
+            if icon_format is not None and path.name == (
+                f"{path.parent.name}_icon.{icon_format}"
+            ):
+                # The icon belongs to the data.sav save of the same folder
+                container_name = path.with_name("datasav").as_posix()
+                containers.setdefault(container_name, []).append(("icon", fpath))
+                continue
+            if path.name == "data.sav":
+                path = path.with_name("datasav")
+            elif path.name == "data.sys":
+                path = path.with_name("datasys")
+            containers.setdefault(path.as_posix(), []).append(("data", fpath))
+        yield from containers.items()
+
+
+@register_handler("cricket-24")
+class Cricket24Handler(SaveHandler):
+    # 1cnf-folder, but with a file suffix and "CHUNK" suffix removal
+    # TODO: Can there be more than one chunk?
+
+    def iter_saves(self, containers):
         # Each container represents one folder
         for container in containers:
-            folder_name: str = container["name"]
-            for file in container["files"]:
-                fname = file["name"]
+            folder_name: str = container.name
+            for file in container.files:
+                fname = file.name
                 fname = fname.removesuffix(".CHUNK0")
                 if "CHUNK" in fname:
                     raise Exception(
-                        f"Unexpected chunk name in {file['name']}! Please report this issue on the GitHub repository!"
+                        f"Unexpected chunk name in {file.name}! Please report this issue on the GitHub repository!"
                     )
                 fname += ".SAV"
                 zip_fname = f"{folder_name}/{fname}"
-                fpath = file["path"]
-                save_meta.append((zip_fname, fpath))
+                fpath = file.path
+                yield (zip_fname, fpath)
 
-    elif handler_name == "forza":
-        # Container name is the filename prefix, file names inside container are appended to that after "."
+    def import_saves(self, saves):
+        folders: Dict[str, List[Tuple[str, SaveSource]]] = {}
+        for zip_fname, fpath in saves:
+            folder_name, sep, fname = zip_fname.rpartition("/")
+            if not sep:
+                raise ValueError(f'"{zip_fname}" is not in a folder')
+            fname = fname.removesuffix(".SAV") + ".CHUNK0"
+            folders.setdefault(folder_name, []).append((fname, fpath))
+        yield from folders.items()
+
+
+@register_handler("forza")
+class ForzaHandler(SaveHandler):
+    # Container name is the filename prefix, file names inside container are appended to that after "."
+
+    def iter_saves(self, containers):
         for container in containers:
-            for file in container["files"]:
-                fname = f"{container['name']}.{file['name']}"
-                save_meta.append((fname, file["path"]))
-
-    elif handler_name == "arcade-paradise":
-        # Arcade Paradise seems to save to one container with one file, which should be renamed to "RATSaveData.dat" for Steam
-        fpath = containers[0]["files"][0]["path"]
-        save_meta.append(("RATSaveData.dat", fpath))
-
-    elif handler_name == "state-of-decay-2":
-        # This is otherwise identical to 1cnf, but we ignore the path in the file names
-        for file in containers[0]["files"]:
-            fname = file["name"].split("/")[-1] + ".sav"
-            save_meta.append((fname, file["path"]))
-
-    elif handler_name == "railway-empire-2":
-        # Each container is one file.
-        # The files inside the container are "savegame" and "description". It seems that we can ignore "description".
+            for file in container.files:
+                fname = f"{container.name}.{file.name}"
+                yield (fname, file.path)
+
+    def import_saves(self, saves):
+        containers: Dict[str, List[Tuple[str, SaveSource]]] = {}
+        for fname, fpath in saves:
+            container_name, sep, file_name = fname.partition(".")
+            if not sep:
+                raise ValueError(f'"{fname}" has no container name prefix')
+            containers.setdefault(container_name, []).append((file_name, fpath))
+        yield from containers.items()
+
+
+@register_handler("arcade-paradise")
+class ArcadeParadiseHandler(SaveHandler):
+    # Arcade Paradise seems to save to one container with one file, which should be renamed to "RATSaveData.dat" for Steam
+
+    def iter_saves(self, containers):
+        fpath = first_container(containers).files[0].path
+        yield ("RATSaveData.dat", fpath)
+
+    def import_saves(self, saves):
+        for fname, fpath in saves:
+            if fname == "RATSaveData.dat":
+                yield (IMPORT_CONTAINER_NAME, [(IMPORT_FILE_NAME, fpath)])
+
+
+@register_handler("state-of-decay-2")
+class StateOfDecay2Handler(SaveHandler):
+    # This is otherwise identical to 1cnf, but we ignore the path in the file names
+
+    def iter_saves(self, containers):
+        for file in first_container(containers).files:
+            fname = file.name.split("/")[-1] + ".sav"
+            yield (fname, file.path)
+
+    def import_saves(self, saves):
+        # The paths of the file names are not known, the files are imported without them
+        files = [(fname.removesuffix(".sav"), fpath) for fname, fpath in saves]
+        yield (IMPORT_CONTAINER_NAME, files)
+
+
+@register_handler("railway-empire-2")
+class RailwayEmpire2Handler(SaveHandler):
+    # Each container is one file.
+    # The files inside the container are "savegame" and "description". It seems that we can ignore "description".
+
+    def iter_saves(self, containers):
         for container in containers:
-            for file in container["files"]:
-                if file["name"] != "savegame":
+            for file in container.files:
+                if file.name != "savegame":
                     continue
-                save_meta.append((container["name"], file["path"]))
+                yield (container.name, file.path)
 
-    elif handler_name == "coral-island":
-        # 1c1f with ".sav" suffix, but if the file name is prefixed with "Backup", we place it in a folder
-        # without the prefix.
+    def import_saves(self, saves):
+        for fname, fpath in saves:
+            yield (fname, [("savegame", fpath)])
+
+
+@register_handler("coral-island")
+class CoralIslandHandler(SaveHandler):
+    # 1c1f with ".sav" suffix, but if the file name is prefixed with "Backup", we place it in a folder
+    # without the prefix.
+
+    def iter_saves(self, containers):
         for container in containers:
-            fname = f"{container['name']}.sav"
+            fname = f"{container.name}.sav"
             if fname.startswith("Backup"):
                 fname = f"Backup/{fname.removeprefix('Backup')}"
-            fpath = container["files"][0]["path"]
-            save_meta.append((fname, fpath))
+            fpath = container.files[0].path
+            yield (fname, fpath)
 
-    else:
-        raise Exception('Unsupported XGP app "%s"' % store_pkg_name)
+    def import_saves(self, saves):
+        for fname, fpath in saves:
+            container_name = fname.removesuffix(".sav")
+            if container_name.startswith("Backup/"):
+                container_name = f"Backup{container_name.removeprefix('Backup/')}"
+            yield (container_name, [(IMPORT_FILE_NAME, fpath)])
 
-    return save_meta
 
+def get_save_paths(
+    supported_games: GameList,
+    store_pkg_name: str,
+    containers: Iterable[Container],
+) -> List[Tuple[str, SaveSource]]:
+    return list(resolve_saves(store_pkg_name, containers, supported_games))
 
-def main():
-    print("Xbox Game Pass for PC savefile extractor")
-    print("========================================")
 
-    games = read_game_list()
+def resolve_saves(
+    store_pkg_name: str,
+    containers: Iterable[Container],
+    games: GameList | None = None,
+) -> Iterator[Tuple[str, SaveSource]]:
+    # Lazily convert the containers of a game into (file name, source) pairs with the game's
+    # handler. Raises an Exception ('Unsupported XGP app ...') for unsupported games.
     if games is None:
-        print("Failed to read game list. Check that games.json exists and is valid.")
+        games = read_game_list()
+    handler = games.handler(store_pkg_name)
+    return iter_handler_saves(handler, containers)
+
+
+def iter_handler_saves(
+    handler: SaveHandler, containers: Iterable[Container]
+) -> Iterator[Tuple[str, SaveSource]]:
+    # The copies of containers made by --on-conflict keep-both are not given to the handler
+    # with the other containers. Each copy is converted on its own under the name of its
+    # container, and the save files read from the other versions of the conflicting files
+    # are added with a ".conflict" suffix.
+    copies: List[Tuple[Container, set]] = []
+
+    def iter_originals():
+        # A copy follows its container, so the next container is read before the handler
+        # gets one. This also finds the copy when the handler stops after the container.
+        iterator = iter(containers)
+        previous = None
+        try:
+            for container in iterator:
+                if (
+                    previous is not None
+                    and container.guid == previous.guid
+                    and container.name == f"{previous.name}{CONFLICT_COPY_SUFFIX}"
+                ):
+                    alternates = {
+                        other.path
+                        for file, other in zip(previous.files, container.files)
+                        if other.path != file.path
+                    }
+                    copies.append((container._replace(name=previous.name), alternates))
+                    continue
+                if previous is not None:
+                    yield previous
+                previous = container
+            if previous is not None:
+                yield previous
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def iter_copy_saves():
+        while len(copies) > 0:
+            copy, alternates = copies.pop(0)
+            for name, source in handler.iter_saves([copy]):
+                if any(path in alternates for path in source_paths(source)):
+                    yield (f"{name}{CONFLICT_COPY_SUFFIX}", source)
+
+    for entry in handler.iter_saves(iter_originals()):
+        yield entry
+        yield from iter_copy_saves()
+    yield from iter_copy_saves()
+
+
+class UserSaveDir(NamedTuple):
+    # The save directory of one user of one game, found by scan_profile()
+    package_name: str
+    # Gamertag, or the Xbox user ID when it isn't known
+    user: int | str
+    path: Path
+    backup_dirs: List[Path]
+
+
+def scan_profile(
+    packages_root: Path = default_packages_root,
+    games: GameList | None = None,
+    backups: str = "skip",
+) -> Iterator[UserSaveDir]:
+    # Lazily find the save directories of the supported games in a Packages directory
+    if games is None:
+        games = read_game_list()
+    for pkg_name in discover_games(games, packages_root):
+        for user, user_dir, backup_dirs in find_user_containers(
+            pkg_name, packages_root, backups
+        ):
+            yield UserSaveDir(pkg_name, user, user_dir, backup_dirs)
+
+
+def list_save_files(saves_dir: Path) -> List[Tuple[str, Path]]:
+    # ("/" separated relative name, path) pairs of the files under saves_dir, sorted by name
+    saves = []
+    for dir_path, dir_names, file_names in os.walk(saves_dir):
+        count("scandir_calls")
+        rel_dir = PurePath(dir_path).relative_to(saves_dir)
+        for file_name in file_names:
+            saves.append(((rel_dir / file_name).as_posix(), Path(dir_path, file_name)))
+    return sorted(saves)
+
+
+def import_saves(
+    saves_dir: Path,
+    user_wgs_dir: Path,
+    store_pkg_name: str,
+    games: GameList | None = None,
+    threads: int = 4,
+) -> int:
+    # Write the Steam/Epic save files in saves_dir into a new user directory of the game with
+    # the reverse of the game's handler and return the number of containers. The directory
+    # is written to "<name>.partial" and renamed when it is complete.
+    if games is None:
+        games = read_game_list()
+    handler = games.handler(store_pkg_name)
+    if user_wgs_dir.exists():
+        raise FileExistsError(f'"{user_wgs_dir}" already exists')
+    partial_path = user_wgs_dir.with_name(user_wgs_dir.name + PARTIAL_SUFFIX)
+    writer = ContainerIndexWriter(partial_path, store_pkg_name, threads)
+    try:
+        for container_name, files in handler.import_saves(list_save_files(saves_dir)):
+            writer.add(container_name, files)
+        writer.close()
+        os.rename(partial_path, user_wgs_dir)
+    except BaseException:
+        with contextlib.suppress(Exception):
+            writer.files.close()
+        remove_archive(partial_path)
+        raise
+    return len(writer.entries)
+
+
+class ExportManifest:
+    # Remembers the size, mtime and container creation date of every exported file,
+    # keyed by "package/user directory/container GUID/file GUID". With several Packages
+    # directories, the key starts with the ID of the directory.
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if path.is_file():
+            with path.open("r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def is_changed(self, key: str, record: Dict[str, Any]) -> bool:
+        with self.lock:
+            return self.files.get(key) != record
+
+    def replace(self, prefix: str, records: Dict[str, Dict[str, Any]]):
+        # Replace every record of one (package, user) pair and write the manifest to disk
+        with self.lock:
+            self.files = {
+                k: v for k, v in self.files.items() if not k.startswith(prefix)
+            }
+            self.files.update(records)
+            temp_path = self.path.with_name(self.path.name + ".tmp")
+            with temp_path.open("w", encoding="utf-8") as f:
+                json.dump({"version": 1, "files": self.files}, f, indent=1)
+            os.replace(temp_path, self.path)
+
+
+MANIFEST_NAME = "xgp-save-extractor-manifest.json"
+METRICS_NAME = "xgp-save-extractor-metrics.json"
+
+
+def extract_user_saves(
+    games: GameList,
+    package_name: str,
+    xbox_username_or_id: int | str,
+    container_dir: Path,
+    args: argparse.Namespace,
+    manifest: ExportManifest | None = None,
+    backup_dirs: List[Path] | None = None,
+) -> Path | None:
+    name: str = games[package_name]["name"]
+    user = str(xbox_username_or_id)
+    root_id = None
+    if len(args.packages_root or []) > 1:
+        # The user directory is <packages root>/<package>/SystemAppData/wgs/<user>
+        root_id = packages_root_id(container_dir.parents[3])
+
+    if backup_dirs:
+        with measure("parse", name, user) as counters:
+            store_pkg_name, containers = read_user_snapshots(
+                container_dir, backup_dirs, args.on_conflict
+            )
+            if counters is not None:
+                counters["containers"] = len(containers)
+    else:
+        # The containers are decoded one at a time while the handler produces the save files
+        with measure("index", name, user):
+            index = ContainerIndex(container_dir)
+        store_pkg_name = index.store_pkg_name
+        containers = measure_iter(
+            "parse", name, user, index.iter_containers(args.on_conflict), "containers"
+        )
+
+    if manifest is not None:
+        # Only export the files whose source data changed since the last export
+        manifest_prefix = f"{package_name}/{container_dir.name}/"
+        if root_id is not None:
+            manifest_prefix = f"{root_id}/{manifest_prefix}"
+        records = {}
+        path_keys = {}
+
+        def iter_recorded(containers):
+            # Record the files of each container before the handler sees it
+            for container in containers:
+                created = container.creation_date.isoformat()
+                for file in container.files:
+                    key = f"{manifest_prefix}{container.guid.hex}/{file.guid.hex}"
+                    path_keys[file.path] = key
+                    st = file.path.stat()
+                    count("stat_calls")
+                    records[key] = {
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "created": created,
+                    }
+                yield container
+
+        containers = measure_iter(
+            "manifest", name, user, iter_recorded(containers), "containers"
+        )
+
+    # Save files are produced lazily by the handler while they are written into the archive
+    save_paths = measure_iter(
+        "handler", name, user, resolve_saves(store_pkg_name, containers, games)
+    )
+
+    if manifest is not None:
+
+        def is_changed(source: SaveSource) -> bool:
+            return any(
+                manifest.is_changed(path_keys[p], records[path_keys[p]])
+                for p in source_paths(source)
+            )
+
+        def iter_changed(entries):
+            # Files generated by the handler are always included alongside changed files
+            for file_name, source in entries:
+                if len(source_paths(source)) == 0 or is_changed(source):
+                    yield (file_name, source)
+
+        # Look for the first changed file before creating an archive
+        skipped = []
+        for file_name, source in save_paths:
+            skipped.append((file_name, source))
+            if len(source_paths(source)) > 0 and is_changed(source):
+                break
+        else:
+            log(f"  No changes for user {xbox_username_or_id} since the last export")
+            return None
+        save_paths = itertools.chain(iter_changed(skipped), iter_changed(save_paths))
+
+    first_entry = next(save_paths, None)
+    if first_entry is None:
+        return None
+    save_paths = itertools.chain([first_entry], save_paths)
+
+    log(f"  Save files for user {xbox_username_or_id}:")
+
+    # Create an archive (a ZIP file by default)
+    formatted_game_name = (
+        name.replace(" ", "_")
+        .replace(":", "_")
+        .replace("'", "")
+        .replace("!", "")
+        .lower()
+    )
+    archive_prefix = f"{formatted_game_name}_{xbox_username_or_id}_"
+    if root_id is not None:
+        archive_prefix += f"{root_id}_"
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H_%M_%S")
+    archive_stem = f"{archive_prefix}{timestamp}"
+    archive_ext = archive_extension(args.format, args.compression)
+    archive_path = args.output_dir / f"{archive_stem}{archive_ext}"
+    resume = args.resume and can_resume(args.format, args.compression)
+    if resume:
+        # Continue an interrupted export of the same game and user
+        partial_export = find_partial_export(
+            args.output_dir, archive_prefix, archive_ext
+        )
+        if partial_export is not None:
+            log(f'  Resuming the interrupted export "{partial_export}"')
+            archive_path = partial_export
+
+    progress = None
+    if args.progress:
+        # The totals are needed for the ETA, so the files are listed before writing
+        save_paths = list(save_paths)
+        progress = ExportProgress(
+            f"{name} ({xbox_username_or_id})",
+            len(save_paths),
+            sum(source_size(source) for _, source in save_paths),
+        )
+
+    file_count = 0
+
+    def iter_logged(entries):
+        nonlocal file_count
+        for file_name, source in entries:
+            log(f"  - {file_name}")
+            yield (file_name, source)
+            file_count += 1
+
+    with measure("archive", name, user) as counters:
+        try:
+            archive_path = export(
+                iter_logged(save_paths),
+                archive_path,
+                args.format,
+                args.compression,
+                args.compression_level,
+                args.threads,
+                resume,
+                progress,
+            )
+        except BaseException:
+            if resume:
+                log(
+                    "  The partial export was kept, run again with --resume to continue it"
+                )
+            raise
+        if progress is not None:
+            progress.finish()
+        if counters is not None:
+            counters["files"] = file_count
+            # The content-addressed store counts the new objects while writing
+            counters["bytes_written"] = counters.get("bytes_written", 0) + archive_size(
+                archive_path
+            )
+
+    if args.verify:
+        with measure("verify", name, user) as counters:
+            problems = verify_user_saves(
+                games,
+                container_dir,
+                archive_path,
+                args,
+                backup_dirs,
+                complete=manifest is None,
+            )
+            if counters is not None:
+                counters["files"] = file_count
+        if len(problems) > 0:
+            log(f"  The export doesn't match the saves:")
+            for problem in problems:
+                log(f"  - {problem}")
+            raise VerifyError(f'"{archive_path}" doesn\'t match the saves')
+        log(f"  Verified {file_count} file(s)")
+
+    if manifest is not None:
+        manifest.replace(manifest_prefix, records)
+
+    log()
+    log('  Save files written to "%s"' % archive_path)
+    log()
+    return archive_path
+
+
+# inotify(7) events that mark a change of a watched user directory
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+# Watch descriptor, mask, cookie, name length, followed by the name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class DirectoryWatcher:
+    # Waits for changes of user directories. Uses inotify on Linux, so waiting doesn't use
+    # any CPU. Elsewhere, and for directories that can't be watched (e.g. they were removed
+    # by a sync), the containers.index files are checked every poll_interval seconds.
+
+    def __init__(self, paths: List[Path], poll_interval: float = 2.0):
+        self.paths = list(paths)
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.libc = None
+        self.watches: Dict[int, Path] = {}
+        self.snapshots = {path: self.snapshot(path) for path in self.paths}
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (OSError, AttributeError):
+                fd = -1
+            if fd >= 0:
+                self.libc = libc
+                self.fd = fd
+                self.add_watches()
+        self.method = "inotify" if self.fd is not None else "polling"
+
+    def add_watches(self) -> List[Path]:
+        # Watch the directories that aren't watched yet, returns the newly watched ones
+        watched = set(self.watches.values())
+        added = []
+        for path in self.paths:
+            if path in watched:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = path
+                added.append(path)
+        return added
+
+    def poll(self, path: Path) -> bool:
+        snapshot = self.snapshot(path)
+        if snapshot == self.snapshots[path]:
+            return False
+        self.snapshots[path] = snapshot
+        return True
+
+    def snapshot(self, path: Path) -> Tuple[int, int, int] | None:
+        try:
+            st = (path / "containers.index").stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def read_events(self) -> set:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size + name_len
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.paths)
+                continue
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                # The directory was removed, it is polled until it can be watched again
+                del self.watches[wd]
+            changed.add(path)
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set:
+        # Return the directories that changed, or an empty set after timeout seconds
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            if self.fd is not None:
+                # Changes from before a directory is watched again are found by polling it
+                changed.update(path for path in self.add_watches() if self.poll(path))
+            watched = set(self.watches.values())
+            polled = [path for path in self.paths if path not in watched]
+            wait_time = None
+            if deadline is not None:
+                wait_time = max(0.0, deadline - time.monotonic())
+            if len(changed) > 0:
+                wait_time = 0.0
+            elif len(polled) > 0:
+                if wait_time is None:
+                    wait_time = self.poll_interval
+                else:
+                    wait_time = min(wait_time, self.poll_interval)
+
+            if self.fd is not None:
+                ready, _, _ = select.select([self.fd], [], [], wait_time)
+                if ready:
+                    changed.update(self.read_events())
+            else:
+                time.sleep(wait_time)
+            changed.update(path for path in polled if self.poll(path))
+            if len(changed) > 0:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def watch_saves(
+    games: GameList,
+    found_games: List[Tuple[Path, str]],
+    args: argparse.Namespace,
+    manifest: ExportManifest,
+) -> int:
+    # Export the changed saves of a user again when the user directory changes, until
+    # interrupted. Changes are collected until the directory has been quiet for
+    # --watch-delay seconds, e.g. while a cloud sync writes the containers.
+    user_dirs = {}
+    for packages_root, package_name in found_games:
+        for user, container_dir, backup_dirs in select_user_containers(
+            package_name, packages_root, args.user, args.backups
+        ):
+            user_dirs[container_dir] = (package_name, user, backup_dirs)
+    if len(user_dirs) == 0:
+        print("No save directories to watch")
+        return EXIT_NOTHING_FOUND
+
+    watcher = DirectoryWatcher(list(user_dirs))
+    print(
+        f"Watching {len(user_dirs)} save directories for changes ({watcher.method}), "
+        "press Ctrl+C to stop"
+    )
+    print()
+    # Time of the last change of each directory that hasn't been exported yet
+    changed: Dict[Path, float] = {}
+    try:
+        while True:
+            timeout = None
+            if len(changed) > 0:
+                next_export = min(changed.values()) + args.watch_delay
+                timeout = max(0.0, next_export - time.monotonic())
+            for container_dir in watcher.wait(timeout):
+                changed[container_dir] = time.monotonic()
+            now = time.monotonic()
+            for container_dir, changed_time in list(changed.items()):
+                if now - changed_time < args.watch_delay:
+                    continue
+                del changed[container_dir]
+                package_name, user, backup_dirs = user_dirs[container_dir]
+                print("- %s" % games[package_name]["name"])
+                try:
+                    extract_user_saves(
+                        games,
+                        package_name,
+                        user,
+                        container_dir,
+                        args,
+                        manifest,
+                        backup_dirs,
+                    )
+                except Exception:
+                    print(f"  Failed to extract saves:")
+                    traceback.print_exc()
+                    print()
+    except KeyboardInterrupt:
+        print("Stopped watching")
+        return EXIT_OK
+    finally:
+        watcher.close()
+
+
+def verify_user_saves(
+    games: GameList,
+    container_dir: Path,
+    archive_path: Path,
+    args: argparse.Namespace,
+    backup_dirs: List[Path] | None = None,
+    complete: bool = True,
+) -> List[str]:
+    # Read the containers again and compare their save files with the exported archive.
+    # The warnings were already shown by the export, so they are not repeated.
+    output = getattr(job_output, "buffer", None)
+    job_output.buffer = io.StringIO()
+    try:
+        if backup_dirs:
+            store_pkg_name, containers = read_user_snapshots(
+                container_dir, backup_dirs, args.on_conflict
+            )
+        else:
+            store_pkg_name, containers = read_user_containers(
+                container_dir, args.on_conflict
+            )
+    finally:
+        job_output.buffer = output
+    saves = get_save_paths(games, store_pkg_name, containers)
+    return verify_export(
+        saves,
+        archive_path,
+        args.format,
+        args.compression,
+        args.threads or DEFAULT_THREADS,
+        complete,
+    )
+
+
+def expand_store_manifest(manifest_path: Path, args: argparse.Namespace) -> Path:
+    # Write the files of a content-addressed manifest into an archive of the --format layout
+    files = read_store_manifest(manifest_path)
+    archive_ext = archive_extension(args.format, args.compression)
+
+    def iter_logged(entries):
+        for file_name, object_path, mtime in entries:
+            log(f"  - {file_name}")
+            yield (file_name, object_path, mtime)
+
+    return export(
+        iter_logged(files),
+        args.output_dir / f"{manifest_path.stem}{archive_ext}",
+        args.format,
+        args.compression,
+        args.compression_level,
+        args.threads,
+    )
+
+
+def run_job(
+    games: GameList,
+    package_name: str,
+    xbox_username_or_id: int | str,
+    container_dir: Path,
+    args: argparse.Namespace,
+    manifest: ExportManifest | None = None,
+    backup_dirs: List[Path] | None = None,
+) -> Tuple[str, bool]:
+    # Extract one (package, user) pair in a worker thread and return its collected output
+    # and whether it succeeded
+    job_output.buffer = io.StringIO()
+    try:
+        log("- %s" % games[package_name]["name"])
+        try:
+            extract_user_saves(
+                games,
+                package_name,
+                xbox_username_or_id,
+                container_dir,
+                args,
+                manifest,
+                backup_dirs,
+            )
+            succeeded = True
+        except Exception:
+            log(f"  Failed to extract saves:")
+            log(traceback.format_exc())
+            succeeded = False
+        return (job_output.buffer.getvalue(), succeeded)
+    finally:
+        job_output.buffer = None
+
+
+def select_games(games: GameList, selectors: List[str] | None) -> List[str]:
+    # Match --game values against package names and game names
+    if not selectors:
+        return list(games.keys())
+    selected = []
+    for selector in selectors:
+        pkg_name = games.find(selector)
+        if pkg_name is not None and pkg_name not in selected:
+            selected.append(pkg_name)
+    return selected
+
+
+def select_user_containers(
+    pkg_name: str,
+    packages_root: Path,
+    selectors: List[str] | None,
+    backups: str = "skip",
+) -> List[Tuple[int | str, Path, List[Path]]]:
+    # Match --user values against gamertags, decimal user IDs and hexadecimal user IDs
+    user_containers = find_user_containers(pkg_name, packages_root, backups)
+    if not selectors:
+        return user_containers
+    wanted = {s.lower() for s in selectors}
+    selected = []
+    for xbox_username_or_id, container_dir, backup_dirs in user_containers:
+        user_id_hex = container_dir.name.split("_", 1)[0]
+        candidates = {
+            str(xbox_username_or_id).lower(),
+            user_id_hex.lower(),
+            str(int(user_id_hex, 16)),
+        }
+        if candidates & wanted:
+            selected.append((xbox_username_or_id, container_dir, backup_dirs))
+    return selected
+
+
+def wait_and_exit(status: int):
+    if interactive:
         print()
         print("Press enter to quit")
         input()
-        sys.exit(1)
+    sys.exit(status)
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Extract Xbox Game Pass for PC save files into ZIP files.",
+        epilog=f"Exit status: {EXIT_OK} when all saves were extracted, "
+        f"{EXIT_ERROR} on fatal errors (e.g. invalid games.json), "
+        f"{EXIT_USAGE} on invalid arguments, "
+        f"{EXIT_NOTHING_FOUND} when no supported games or saves were found and "
+        f"{EXIT_PARTIAL_FAILURE} when extracting failed for some games or users.",
+    )
+    parser.add_argument(
+        "--packages-root",
+        type=Path,
+        action="append",
+        metavar="DIR",
+        help="the Packages directory to search for games, e.g. from a mounted Windows profile. "
+        "Can be given multiple times. (default: %%LOCALAPPDATA%%\\Packages)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("."),
+        metavar="DIR",
+        help="directory to write the archives to (default: current directory)",
+    )
+    parser.add_argument(
+        "--game",
+        action="append",
+        metavar="GAME",
+        help="only extract saves of this game, given as the game name or the package name. "
+        "Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--user",
+        action="append",
+        metavar="USER",
+        help="only extract saves of this user, given as the gamertag or the Xbox user ID. "
+        "Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--non-interactive",
+        action="store_true",
+        help="never wait for enter, for running unattended",
+    )
+    parser.add_argument(
+        "--on-conflict",
+        choices=CONFLICT_POLICIES,
+        default="skip",
+        help="what to do when two files exist for the same save file: "
+        "skip the file with a warning, fail the extraction, use the newest or the largest file, "
+        "or keep both by using the newest file and exporting the save file made from the other "
+        f'one with a "{CONFLICT_COPY_SUFFIX}" suffix. The decisions are listed for each user. '
+        "(default: skip)",
+    )
+    parser.add_argument(
+        "--backups",
+        choices=BACKUP_POLICIES,
+        default="skip",
+        help="what to do with the backups that the Xbox app makes of the save directory: "
+        "skip them with a warning or use the newest copy of each container from the save "
+        "directory and its backups (default: skip)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="extract up to N (game, user) pairs in parallel (default: 1). "
+        "Sync warnings do not wait for enter when N is greater than 1.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"only export save files that changed since the last run, tracked in {MANIFEST_NAME}. "
+        "No archive is written when nothing changed.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running after the export and export the changed save files of a user again "
+        "when the user's save directory changes. Implies --incremental and --non-interactive.",
+    )
+    parser.add_argument(
+        "--watch-delay",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="with --watch, wait until a save directory hasn't changed for SECONDS before "
+        "exporting, e.g. while a cloud sync is in progress (default: 5)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["zip", "tar", "dir", "cas"],
+        default="zip",
+        help='archive format (default: zip). "dir" writes the files into a directory without compression. '
+        '"cas" writes every distinct file once into a content-addressed store in the output directory '
+        "and a JSON manifest per (game, user) pair that lists the files by their SHA-256 hash.",
+    )
+    parser.add_argument(
+        "--expand",
+        type=Path,
+        action="append",
+        metavar="MANIFEST",
+        help="instead of extracting, write the files listed in a manifest written with --format cas "
+        "into an archive of --format in the output directory. Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_dirs",
+        type=Path,
+        action="append",
+        metavar="DIR",
+        help="instead of extracting, write Steam/Epic saves of the --game into new wgs containers. "
+        "DIR has a directory with the save files per user, named by the hexadecimal Xbox user ID "
+        "or like the user's wgs directory. The containers are written to "
+        "OUTPUT_DIR/<package>/SystemAppData/wgs, which can be read with --packages-root OUTPUT_DIR. "
+        "Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="keep the partial archive when an export is interrupted or fails, and continue "
+        "the newest partial archive of the same game and user instead of starting over. "
+        "Files already in the partial archive are kept as they are. "
+        "Compressed tar files can't be resumed.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="after each export, read the containers again and compare the save files with "
+        "the archive: with the CRC-32s of a ZIP file, the SHA-256s of a --format cas manifest, "
+        "or by hashing the files of a tar file or directory. A mismatch fails the export.",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="report the files and bytes written, the throughput and the estimated time left "
+        "of each archive on stderr",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        metavar="N",
+        help="threads used to write the files of one (game, user) pair with --format dir "
+        f"(default: {DEFAULT_THREADS}). When given, ZIP entries are also compressed in "
+        "blocks by N threads with deflate or auto compression.",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=CHUNK_SIZE // 1024,
+        metavar="KIB",
+        help=f"size of the chunks save files are read in (default: {CHUNK_SIZE // 1024})",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        metavar="MIB",
+        help="limit the memory used by the read buffers of all threads and jobs together. "
+        "Readers wait for each other when the limit is reached (default: no limit).",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_CHOICES,
+        default="deflate",
+        help="compression method (default: deflate). "
+        '"store" does not compress, "auto" (ZIP only) stores the files that do not compress well. '
+        '"zstd" needs Python 3.14+ for ZIP or the "zstandard" package for tar.',
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        metavar="LEVEL",
+        help="compression level: 0-9 for deflate and lzma (tar only), 1-9 for bzip2, "
+        "1-22 for zstd",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record the wall time, bytes read and written, file counts and file system calls "
+        "of each extraction phase, game and user, and write them to "
+        f"{METRICS_NAME} in the output directory",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=Path,
+        metavar="FILE",
+        help="like --profile, but write the report to FILE",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        metavar="FILE",
+        help="write a cProfile dump of the main thread to FILE (use with --jobs 1)",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.threads is not None and args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.buffer_size < 1:
+        parser.error("--buffer-size must be at least 1")
+    if args.max_memory is not None and args.max_memory * 1024 < args.buffer_size:
+        parser.error("--max-memory must be at least --buffer-size")
+    if args.format in ("dir", "cas") and args.compression != "deflate":
+        parser.error(f"--compression can't be used with --format {args.format}")
+    if args.expand and args.format == "cas":
+        parser.error("--expand needs an archive --format (zip, tar or dir)")
+    if args.watch and (args.expand or args.import_dirs):
+        parser.error("--watch can't be used with --expand or --import")
+    if args.import_dirs and args.expand:
+        parser.error("--import can't be used with --expand")
+    if args.import_dirs and (not args.game or len(args.game) != 1):
+        parser.error("--import needs exactly one --game")
+    if args.format == "tar" and args.compression == "auto":
+        parser.error('--compression auto is only supported with --format zip')
+    if args.compression_level is not None:
+        if args.format in ("dir", "cas"):
+            parser.error(f"--compression-level can't be used with --format {args.format}")
+        if args.compression == "store":
+            parser.error("--compression-level can't be used with --compression store")
+        if args.format == "zip" and args.compression == "lzma":
+            # zipfile always uses the default lzma settings
+            parser.error("--compression-level can't be used with lzma in ZIP files")
+        low, high = COMPRESSION_LEVELS[args.compression]
+        if not low <= args.compression_level <= high:
+            parser.error(
+                f"--compression-level must be {low}-{high} for {args.compression}"
+            )
+    if args.compression == "zstd":
+        if args.format == "zip" and "zstd" not in ZIP_COMPRESSION_METHODS:
+            parser.error("zstd compression in ZIP files requires Python 3.14 or newer")
+        if args.format == "tar" and zstandard is None:
+            parser.error('zstd compression in tar files requires the "zstandard" package')
+    return args
+
+
+def run_expand(args: argparse.Namespace) -> int:
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    failed_count = 0
+    for manifest_path in args.expand:
+        print(f"- {manifest_path}")
+        try:
+            archive_path = expand_store_manifest(manifest_path, args)
+        except Exception:
+            print(f"  Failed to expand the manifest:")
+            traceback.print_exc()
+            print()
+            failed_count += 1
+            continue
+        print()
+        print('  Save files written to "%s"' % archive_path)
+        print()
+    if failed_count == len(args.expand):
+        return EXIT_ERROR
+    if failed_count > 0:
+        return EXIT_PARTIAL_FAILURE
+    return EXIT_OK
+
+
+def import_user_dir_name(name: str) -> str | None:
+    # Name of the wgs user directory for a user directory of --import, which is named like a
+    # wgs user directory ("<user ID>_<title ID>") or by the hexadecimal Xbox user ID
+    user_id_hex, sep, title_id_hex = name.partition("_")
+    try:
+        user_id = int(user_id_hex, 16)
+        if sep:
+            int(title_id_hex, 16)
+            return name
+    except ValueError:
+        return None
+    return f"{user_id:016X}_{0:032X}"
+
+
+def run_import(args: argparse.Namespace) -> int:
+    try:
+        games = read_game_list()
+    except GameListError as e:
+        print(f"Failed to read game list: {e}")
+        print("Check that games.json exists and is valid.")
+        return EXIT_ERROR
+
+    selected_games = select_games(games, args.game)
+    if len(selected_games) != 1:
+        print("--import needs a --game value that matches one supported game")
+        return EXIT_USAGE
+    package_name = selected_games[0]
+    wgs_dir = args.output_dir / package_name / "SystemAppData/wgs"
+
+    user_dirs = []
+    for import_dir in args.import_dirs:
+        try:
+            saves_dirs = sorted(path for path in import_dir.iterdir() if path.is_dir())
+        except OSError as e:
+            print(f'Failed to read "{import_dir}": {e}')
+            return EXIT_ERROR
+        for saves_dir in saves_dirs:
+            user_dir_name = import_user_dir_name(saves_dir.name)
+            if user_dir_name is None:
+                print(f'Skipping "{saves_dir}", the name is not an Xbox user ID')
+                continue
+            user_dirs.append((saves_dir, wgs_dir / user_dir_name))
+    if len(user_dirs) == 0:
+        print("No user directories to import")
+        return EXIT_NOTHING_FOUND
+
+    print(f'Importing {games[package_name]["name"]} saves:')
+    failed_count = 0
+    # Every user is an independent job, the files of each user are written by --threads threads
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(
+                import_saves,
+                saves_dir,
+                user_dir,
+                package_name,
+                games,
+                args.threads or DEFAULT_THREADS,
+            )
+            for saves_dir, user_dir in user_dirs
+        ]
+        for (saves_dir, user_dir), future in zip(user_dirs, futures):
+            print(f"- {saves_dir}")
+            try:
+                container_count = future.result()
+            except Exception:
+                print(f"  Failed to import saves:")
+                traceback.print_exc()
+                print()
+                failed_count += 1
+                continue
+            print(f'  {container_count} container(s) written to "{user_dir}"')
+    print()
+    if failed_count == len(user_dirs):
+        return EXIT_ERROR
+    if failed_count > 0:
+        return EXIT_PARTIAL_FAILURE
+    return EXIT_OK
+
+
+def run(args: argparse.Namespace) -> int:
+    if args.expand:
+        return run_expand(args)
+    if args.import_dirs:
+        return run_import(args)
+
+    packages_roots: List[Path] = args.packages_root or [default_packages_root]
+
+    try:
+        games = read_game_list()
+    except GameListError as e:
+        print(f"Failed to read game list: {e}")
+        print("Check that games.json exists and is valid.")
+        return EXIT_ERROR
+
+    selected_games = select_games(games, args.game)
+    if len(selected_games) == 0:
+        print("No supported game matches the given --game values")
+        return EXIT_USAGE
+
+    missing_roots = [root for root in packages_roots if not root.is_dir()]
+    if len(missing_roots) > 0:
+        for root in missing_roots:
+            print(f'Packages directory "{root}" does not exist')
+        return EXIT_ERROR
 
     # Discover supported games
-    found_games = discover_games(games)
+    with measure("discovery"):
+        found_games = discover_games_in_roots(
+            {pkg_name: games[pkg_name] for pkg_name in selected_games}, packages_roots
+        )
 
     if len(found_games) == 0:
         print("No supported games installed")
-        print()
-        print("Press enter to quit")
-        input()
-        sys.exit(1)
+        return EXIT_NOTHING_FOUND
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = (
+        ExportManifest(args.output_dir / MANIFEST_NAME)
+        if args.incremental or args.watch
+        else None
+    )
+
+    succeeded_count = 0
+    failed_count = 0
 
     print("Installed supported games:")
-    for package_name in found_games:
-        name: str = games[package_name]["name"]
-        print("- %s" % name)
+    if args.jobs == 1:
+        for packages_root, package_name in found_games:
+            name: str = games[package_name]["name"]
+            print("- %s" % name)
+
+            try:
+                with measure("discovery", name):
+                    user_containers = select_user_containers(
+                        package_name, packages_root, args.user, args.backups
+                    )
+                if len(user_containers) == 0:
+                    print(
+                        "  No containers for the game, maybe the game is not installed anymore"
+                    )
+                    print()
+                    continue
 
-        try:
-            user_containers = find_user_containers(package_name)
+                for xbox_username_or_id, container_dir, backup_dirs in user_containers:
+                    extract_user_saves(
+                        games,
+                        package_name,
+                        xbox_username_or_id,
+                        container_dir,
+                        args,
+                        manifest,
+                        backup_dirs,
+                    )
+                    succeeded_count += 1
+
+            except Exception:
+                print(f"  Failed to extract saves:")
+                traceback.print_exc()
+                print()
+                failed_count += 1
+    else:
+        # Every (package, user) pair is an independent job
+        jobs = []
+        for packages_root, package_name in found_games:
+            try:
+                with measure("discovery", games[package_name]["name"]):
+                    user_containers = select_user_containers(
+                        package_name, packages_root, args.user, args.backups
+                    )
+            except Exception:
+                print("- %s" % games[package_name]["name"])
+                print(f"  Failed to extract saves:")
+                traceback.print_exc()
+                print()
+                failed_count += 1
+                continue
             if len(user_containers) == 0:
+                print("- %s" % games[package_name]["name"])
                 print(
                     "  No containers for the game, maybe the game is not installed anymore"
                 )
                 print()
                 continue
+            for xbox_username_or_id, container_dir, backup_dirs in user_containers:
+                jobs.append(
+                    (package_name, xbox_username_or_id, container_dir, backup_dirs)
+                )
 
-            for xbox_username_or_id, container_dir in user_containers:
-                read_result = read_user_containers(container_dir)
-                store_pkg_name, containers = read_result
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                executor.submit(
+                    run_job, games, *job[:3], args, manifest, backup_dirs=job[3]
+                )
+                for job in jobs
+            ]
+            # Print the output of each job as a whole, in submission order
+            for future in futures:
+                job_output_text, job_succeeded = future.result()
+                print(job_output_text, end="")
+                if job_succeeded:
+                    succeeded_count += 1
+                else:
+                    failed_count += 1
 
-                # Create tempfile directory
-                # Some save files need this, as we need to create files that do not exist in the XGP save data
-                temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+    if args.watch:
+        return watch_saves(games, found_games, args, manifest)
+    if failed_count > 0:
+        return EXIT_PARTIAL_FAILURE
+    if succeeded_count == 0:
+        return EXIT_NOTHING_FOUND
+    return EXIT_OK
 
-                # Get save file paths
-                save_paths = get_save_paths(games, store_pkg_name, containers, temp_dir)
-                if len(save_paths) == 0:
-                    continue
-                print(f"  Save files for user {xbox_username_or_id}:")
-                for file_name, _ in save_paths:
-                    print(f"  - {file_name}")
-
-                # Create a ZIP file
-                formatted_game_name = (
-                    name.replace(" ", "_")
-                    .replace(":", "_")
-                    .replace("'", "")
-                    .replace("!", "")
-                    .lower()
-                )
-                timestamp = datetime.now().strftime("%Y-%m-%d_%H_%M_%S")
-                zip_name = "{}_{}_{}.zip".format(
-                    formatted_game_name, xbox_username_or_id, timestamp
-                )
-                with zipfile.ZipFile(zip_name, "x", zipfile.ZIP_DEFLATED) as save_zip:
-                    for file_name, file_path in save_paths:
-                        save_zip.write(file_path, arcname=file_name)
 
-                temp_dir.cleanup()
+def main(argv: List[str] | None = None):
+    global interactive, metrics, buffer_size, buffer_budget
 
-                print()
-                print('  Save files written to "%s"' % zip_name)
-                print()
+    args = parse_args(argv)
+    interactive = not args.non_interactive and not args.watch
+    buffer_size = args.buffer_size * 1024
+    if args.max_memory is not None:
+        buffer_budget = BufferBudget(args.max_memory * 1024 * 1024)
+    if args.profile or args.metrics_json is not None:
+        metrics = Metrics()
 
-        except Exception:
-            print(f"  Failed to extract saves:")
-            traceback.print_exc()
-            print()
+    print("Xbox Game Pass for PC savefile extractor")
+    print("========================================")
 
-    print()
-    print("Press enter to quit")
-    input()
+    profiler = cProfile.Profile() if args.cprofile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        status = run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        if metrics is not None:
+            metrics_path = args.metrics_json or args.output_dir / METRICS_NAME
+            metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            with metrics_path.open("w", encoding="utf-8") as f:
+                json.dump(metrics.report(), f, indent=1)
+            print()
+            print(f'Metrics written to "{metrics_path}"')
+    wait_and_exit(status)
 
 
 if __name__ == "__main__":